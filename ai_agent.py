@@ -4,6 +4,11 @@ from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from gmail_service import send_email 
+from email_templates import render
+from rate_limiter import call
+from product_catalog import get_catalog
+from intent_classifier import INTENTS, MIN_CONFIDENCE, classify
+from mailboxes import mailbox_for
 
 
 # Load environment variables
@@ -41,17 +46,63 @@ Customer Email:
 chain = prompt | model
 
 
+intent_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You classify emails for a food product shipping company."),
+    ("human", """
+Classify the intent of this email as exactly one of: {intents}.
+
+Email:
+{email_text}
+
+Return only the intent label.
+""")
+])
+
+intent_chain = intent_prompt | model
+
+
+def ask_gemini_intent(email_text: str):
+    """Escalation path for low-confidence local predictions. Returns: intent label or None"""
+    response = call("gemini", "generate", lambda: intent_chain.invoke({
+        "email_text": email_text,
+        "intents": ", ".join(INTENTS),
+    }))
+    label = response.content.strip().lower().strip(".`'\" ")
+    return label if label in INTENTS else None
+
+
+def detect_intent(email_text: str, subject: str = "", escalate: bool = True):
+    """
+    Local classifier first; Gemini only when its confidence is below MIN_CONFIDENCE.
+    Returns: (intent, confidence, source) with source 'model' or 'gemini'
+    """
+    intent, confidence = classify(f"{subject}\n{email_text}")
+    if escalate and confidence < MIN_CONFIDENCE:
+        try:
+            gemini_intent = ask_gemini_intent(email_text)
+        except Exception as e:
+            print("⚠️ Gemini intent check failed, keeping local prediction:", e)
+            gemini_intent = None
+        if gemini_intent:
+            return gemini_intent, confidence, "gemini"
+    return intent, confidence, "model"
+
 
 # FUNCTION: Analyze and respond to customer emails
 
-def generate_reply(email_text: str, subject: str = "") -> tuple[str, bool, dict, bool]:
+def generate_reply(email_text: str, subject: str = "", known: dict = None,
+                   escalate: bool = True, mixed_inbox: bool = True) -> tuple[str, bool, dict, bool]:
     """
-    Analyze incoming email using Gemini + regex.
+    Analyze incoming email using the intent classifier (+ Gemini when unsure) and regex.
+    `known` holds details already collected earlier in the conversation;
+    fields found in this email take precedence.
+    `escalate=False` never calls Gemini (e.g. when re-deriving details for display).
+    `mixed_inbox=False` (a customer-only mailbox) skips the "vendor"-in-subject routing.
     Returns: (reply_text, all_details_collected, details_dict, ignored)
     """
 
  
-    if "vendor" in subject.lower():
+    if mixed_inbox and "vendor" in subject.lower():
         print("⚠️ Ignored vendor email based on subject content.")
         return None, False, {}, True
 
@@ -61,12 +112,13 @@ def generate_reply(email_text: str, subject: str = "") -> tuple[str, bool, dict,
         "product_name": None,
         "price": None,
         "quantity": None,
+        "sku": None,
         "query_type": "order"  # default assumption
     }
 
    
     order_id_match = re.search(r'(?i)(?:order[\s_-]*(?:id)?[\s#:=-]*)(\d{2,})', email_text)
-    product_match = re.search(r'(?i)(?:product\s*(?:name)?[:\- ]*)([A-Za-z0-9\s]+)', email_text)
+    product_match = re.search(r'(?i)(?:product\s*(?:name)?[:\- ]*)([A-Za-z0-9 \t]+)', email_text)
     price_match = re.search(r'(?i)(?:price|cost)[:\- ]*₹?\s?(\d+[,.]?\d*)', email_text)
     quantity_match = re.search(r'(?i)(?:quantity|qty|pieces|units|packs)[:\- ]*(\d+)', email_text)
 
@@ -79,16 +131,39 @@ def generate_reply(email_text: str, subject: str = "") -> tuple[str, bool, dict,
     if quantity_match:
         details["quantity"] = quantity_match.group(1).strip()
 
-    # Detect shipping-related keywords
-    shipping_keywords = [
-        "delivery", "ship", "shipping", "status", "dispatched", "arrive", "track", "tracking",
-        "where is my order", "delivered", "dispatch", "when will"
-    ]
-    email_lower = email_text.lower()
-    is_shipping_query = any(keyword in email_lower for keyword in shipping_keywords)
+    # Normalize the product against the catalog and sanity-check price/quantity
+    if details["product_name"]:
+        product = get_catalog().resolve(details["product_name"])
+        if product:
+            details["product_name"] = product["name"]
+            details["sku"] = product["sku"]
+            details["catalog_issues"] = get_catalog().validate(
+                product, details["price"], details["quantity"]
+            )
 
-    if is_shipping_query:
-        details["query_type"] = "shipping"
+    # Fill gaps from earlier messages in the same thread
+    for key, value in (known or {}).items():
+        if key in details and not details[key] and value:
+            details[key] = value
+
+    # Classify intent (order / shipping / cancellation / complaint / vendor_reply)
+    intent, confidence, source = detect_intent(email_text, subject, escalate)
+    details["query_type"] = intent
+    details["intent_confidence"] = round(confidence, 3)
+    details["intent_source"] = source
+
+    # only a mixed inbox receives vendor mail; a customer inbox (or a shaky guess)
+    # must not silently drop the email: answer it as an order instead
+    if intent == "vendor_reply":
+        if mixed_inbox and (source == "gemini" or confidence >= MIN_CONFIDENCE):
+            print(f"⚠️ Ignored email classified as a vendor reply ({confidence:.2f}, {source}).")
+            return None, False, details, True
+        # the record keeps the vendor_reply prediction, marked as overridden: it is neither an
+        # order for the analytics nor a training label (only gemini/manager labels are)
+        intent = "order"
+        details["intent_source"] = "override"
+
+    is_shipping_query = intent == "shipping"
 
     # Validate completeness for orders
     all_details_collected = bool(details["order_id"] and details["product_name"])
@@ -97,19 +172,15 @@ def generate_reply(email_text: str, subject: str = "") -> tuple[str, bool, dict,
     if is_shipping_query:
         # --- SHIPPING QUERY HANDLING ---
         if details["order_id"]:
-            reply_text = (
-                f"Dear Customer,\n\n"
-                f"Thank you for reaching out. We’ve received your shipping enquiry "
-                f"for Order ID {details['order_id']}. We will check with the vendor "
-                f"and update you shortly.\n\n"
-                f"Best regards,\nAI Shipping Assistant"
-            )
+            _, reply_text = render("customer_shipping_ack", subject=subject, order_id=details["order_id"])
         else:
-            reply_text = (
-                f"Dear Customer,\n\n"
-                f"Could you please provide your Order ID so we can check your delivery status?\n\n"
-                f"Thank you,\nAI Shipping Assistant"
-            )
+            _, reply_text = render("customer_shipping_missing_id", subject=subject)
+
+    elif intent == "cancellation":
+        _, reply_text = render("customer_cancellation_ack", subject=subject, order_id=details["order_id"] or "N/A")
+
+    elif intent == "complaint":
+        _, reply_text = render("customer_complaint_ack", subject=subject, order_id=details["order_id"] or "N/A")
 
     else:
         # --- NEW ORDER HANDLING ---
@@ -121,60 +192,41 @@ def generate_reply(email_text: str, subject: str = "") -> tuple[str, bool, dict,
                 missing_parts.append("Product Name")
 
             missing_text = " and ".join(missing_parts)
-            reply_text = (
-                f"Dear Customer,\n\n"
-                f"We couldn’t locate your {missing_text} in the email. "
-                f"Kindly share these details to help us process your request.\n\n"
-                f"Thank you,\nAI Order Assistant"
-            )
+            _, reply_text = render("customer_order_missing", subject=subject, missing_text=missing_text)
         else:
-            reply_text = (
-                f"Dear Customer,\n\n"
-                f"Thank you for reaching out. We have received your query regarding "
-                f"Order #{details['order_id']} for product '{details['product_name']}'. "
-                f"Our manager will review and process it shortly.\n\n"
-                f"Best regards,\nAI Order Assistant"
+            _, reply_text = render(
+                "customer_order_received",
+                subject=subject,
+                order_id=details["order_id"],
+                product_name=details["product_name"],
             )
 
     print("🧩 Extracted Details:", details)
-    print("🚚 Is Shipping Query:", is_shipping_query)
+    print(f"🏷 Intent: {intent} ({confidence:.2f}, {details['intent_source']})")
     return reply_text, all_details_collected, details, False
 
 
 
 # FUNCTION: Send shipment/payment update to customer
 
-def send_customer_update(customer_email, vendor_status, payment_amount, approved=True):
+def build_customer_update(vendor_status, payment_amount, approved=True):
+    """Returns: (subject, body) for a shipment/payment update to the customer"""
     if approved:
-        subject = "Your Order Update – Product Shipment Confirmed"
-        body = f"""
-Dear Customer,
-
-Good news! The vendor has confirmed your product shipment.
-
-📦 Status: {vendor_status}
-💰 Payment Amount: ₹{payment_amount or 'N/A'}
-
-Thank you for shopping with us!
-Best regards,  
-AI Shipping Assistant
-        """
-    else:
-        subject = "Your Order Update – Shipment Rejected"
-        body = f"""
-Dear Customer,
-
-Unfortunately, your order could not be shipped due to vendor unavailability.
-
-📦 Status: {vendor_status or 'Not Shipped'}
-💰 Refund Amount: ₹{payment_amount or 'N/A'}
-
-We apologize for the inconvenience.
-Best regards,  
-AI Shipping Assistant
-        """
-
-    send_email(customer_email, subject, body)
+        return render(
+            "customer_update_approved",
+            vendor_status=vendor_status,
+            payment_amount=payment_amount or "N/A",
+        )
+    return render(
+        "customer_update_rejected",
+        vendor_status=vendor_status or "Not Shipped",
+        payment_amount=payment_amount or "N/A",
+    )
+
+
+def send_customer_update(customer_email, vendor_status, payment_amount, approved=True, mailbox=None):
+    subject, body = build_customer_update(vendor_status, payment_amount, approved)
+    send_email(customer_email, subject, body, mailbox=mailbox or mailbox_for("customer"))
     print(f"✅ Sent update email to customer: {customer_email}")
 
 
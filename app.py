@@ -4,12 +4,21 @@ import re
 from db_service import (
     get_all_records,
     mark_as_approved,
+    mark_many_as_approved,
     update_manager_decision,
-    get_pending_vendor_updates
+    update_manager_decisions,
+    get_pending_vendor_updates,
+    search_records,
+    get_facet_values,
+    get_archived_records,
+    get_analytics,
 )
 from vendor_service import send_vendor_email
-from ai_agent import send_customer_update, generate_reply
+from ai_agent import send_customer_update, build_customer_update, generate_reply
 from gmail_service import send_email  
+from email_templates import render
+from outbox_service import start_outbox_worker
+from mailboxes import mailbox_for
 
 
 # Streamlit Page Setup
@@ -17,14 +26,117 @@ st.set_page_config(page_title="AI Email Agent", page_icon="📦", layout="wide")
 st.title("📧 AI Email Agent – Manager Dashboard")
 
 
+# Background sender for bulk actions (one per server process)
+@st.cache_resource
+def _outbox_worker():
+    return start_outbox_worker()
+
+
+_outbox_worker()
+
+
+# ANALYTICS (precomputed summary tables — constant time per rerun)
+analytics = get_analytics()
+with st.expander("📊 Analytics", expanded=False):
+    m1, m2, m3, m4 = st.columns(4)
+    avg_hours = analytics["avg_confirmation_hours"]
+    rate = analytics["approval_rate"]
+    m1.metric("Avg. time to vendor confirmation", f"{avg_hours:.1f} h" if avg_hours is not None else "N/A")
+    m2.metric("Approval rate", f"{rate:.0%}" if rate is not None else "N/A")
+    m3.metric("Approved / Rejected", f"{analytics['approved']} / {analytics['rejected']}")
+    m4.metric("Certificate reminders", analytics["certificate_reminders"])
+
+    st.markdown("### 📈 Orders per Day (last 30 days)")
+    if analytics["orders_per_day"]:
+        st.bar_chart({day: orders for day, orders in analytics["orders_per_day"]})
+    else:
+        st.text("No orders yet.")
+
+    st.markdown("### ⏳ Pending Vendor Replies")
+    if analytics["pending_by_vendor"]:
+        st.table([
+            {"Vendor": v, "Pending replies": p, "Reminders sent": r}
+            for v, p, r in analytics["pending_by_vendor"]
+        ])
+    else:
+        st.text("No pending vendor replies.")
+
+
+# SEARCH
+@st.cache_data(ttl=60)
+def _facets():
+    return get_facet_values()
+
+
+facets = _facets()
+search_col, status_col, decision_col, vendor_col, mailbox_col = st.columns([3, 1, 1, 1, 1])
+search_query = search_col.text_input("🔎 Search emails", placeholder="order id, product, customer email…")
+status_filter = status_col.selectbox("Vendor status", ["All"] + facets["status"])
+decision_filter = decision_col.selectbox("Decision", ["All", "Pending"] + facets["decision"])
+vendor_filter = vendor_col.selectbox("Vendor", ["All"] + facets["vendor"])
+mailbox_filter = mailbox_col.selectbox("Mailbox", ["All"] + facets["mailbox"])
+
+
 # SECTION 1: Customer Emails 
-records = get_all_records()
+searching = bool(search_query) or (status_filter, decision_filter, vendor_filter, mailbox_filter) != ("All",) * 4
+if searching:
+    records = search_records(
+        search_query,
+        status=None if status_filter == "All" else status_filter,
+        decision=None if decision_filter == "All" else decision_filter,
+        vendor=None if vendor_filter == "All" else vendor_filter,
+        mailbox=None if mailbox_filter == "All" else mailbox_filter,
+    )
+else:
+    records = get_all_records()
 
-if not records:
+if not records and searching:
+    st.info("🔎 No records match your search.")
+elif not records:
     st.info("📭 No email records found yet. Run main.py first to process customer emails.")
 else:
     st.subheader("📬 Processed Customer Emails (Pending Vendor Action)")
 
+    # BULK SEND TO VENDOR
+    unapproved = {r[0]: r for r in records if not r[8]}
+    if unapproved:
+        with st.form("bulk_send_form"):
+            st.markdown("### 📦 Bulk Send to Vendor")
+            selected_ids = st.multiselect(
+                "Records",
+                list(unapproved),
+                format_func=lambda rid: f"#{rid} — {unapproved[rid][1]} — {unapproved[rid][4] or 'N/A'}",
+            )
+            bulk_vendor_email = st.text_input("Vendor Email", key="bulk_vendor_email")
+            bulk_shipping = st.text_input("Shipping Charge per Order (₹)", key="bulk_shipping")
+
+            if st.form_submit_button("✅ Approve & Send Selected"):
+                if not selected_ids:
+                    st.error("❌ Please select at least one record.")
+                elif not bulk_vendor_email:
+                    st.error("❌ Please enter a vendor email.")
+                else:
+                    outgoing = []
+                    for rid in selected_ids:
+                        r = unapproved[rid]
+                        try:
+                            total_price = float(r[5] or 0) + float(bulk_shipping or 0)
+                        except ValueError:
+                            total_price = 0
+                        subject, body = render(
+                            "vendor_ship_order",
+                            product_name=r[4] or "N/A",
+                            order_id=r[-2] or "N/A",  # stored emails.order_id
+                            quantity=r[6] or "N/A",
+                            price=r[5] or "N/A",
+                            shipping_charge=bulk_shipping or "N/A",
+                            total_price=total_price,
+                        )
+                        outgoing.append((bulk_vendor_email, subject, body, mailbox_for("vendor")))
+
+                    mark_many_as_approved(selected_ids, bulk_vendor_email, outgoing=outgoing)
+                    st.success(f"✅ {len(selected_ids)} order(s) approved and queued for {bulk_vendor_email}.")
+
     for record in records:
         (
             record_id,
@@ -63,7 +175,9 @@ else:
                 st.success("✅ Already approved and vendor has been notified.")
             else:
                 st.warning("⚠️ Awaiting manager action.")
-                _, _, details, is_shipping_query = generate_reply(email_text, subject="")
+                _, _, details, is_shipping_query = generate_reply(email_text, subject="", escalate=False)
+                for issue in details.get("catalog_issues", []):
+                    st.warning(f"📚 Catalog check: {issue}")
 
                 with st.form(f"approve_form_{record_id}"):
                     vendor_email_input = st.text_input("Vendor Email", value=vendor_email or "", key=f"vendor_{record_id}")
@@ -83,22 +197,15 @@ else:
                             except ValueError:
                                 total_price = 0
 
-                            vendor_message = f"""
-Dear Vendor,
-
-Please ship the following product to the customer:
-
-- Product Name: {product_name or "N/A"}
-- Quantity: {quantity or "N/A"}
-- Unit Price: ₹{price or "N/A"}
-- Shipping Charge: ₹{shipping_charge or "N/A"}
-- Total Price: ₹{total_price}
-
-Kindly attach at least 2 food safety certificates with your shipment confirmation.
-
-Best regards,  
-AI Shipping Manager
-"""
+                            vendor_subject, vendor_message = render(
+                                "vendor_ship_order",
+                                product_name=product_name or "N/A",
+                                order_id=details.get("order_id") or "N/A",
+                                quantity=quantity or "N/A",
+                                price=price or "N/A",
+                                shipping_charge=shipping_charge or "N/A",
+                                total_price=total_price,
+                            )
                             send_vendor_email(
                                 vendor_email_input,
                                 product_name=product_name or "N/A",
@@ -107,9 +214,10 @@ AI Shipping Manager
                                 order_id=details.get("order_id"),
                                 query_type="order",
                                 vendor_message=vendor_message,
+                                vendor_subject=vendor_subject,
                             )
                       
-                            mark_as_approved(record_id)
+                            mark_as_approved(record_id, vendor_email_input)
                             st.success(f"✅ Approved and order sent to vendor: {vendor_email_input}")
 
                     # REQUEST SHIPMENT INFO 
@@ -120,20 +228,11 @@ AI Shipping Manager
                             order_id_match = re.search(r'order\s*id\s*(\d+)', email_text, re.IGNORECASE)
                             order_id = order_id_match.group(1) if order_id_match else details.get("order_id") or "Unknown"
 
-                            enquiry_message = f"""
-Dear Vendor,
-
-We have received a shipment enquiry from a customer.
-
-- Order ID: {order_id}
-- Customer Email: {sender_email}
-
-Please provide the latest delivery status, estimated dispatch date, and tracking details (if available).
-Attach at least 2 food safety certificates with your reply.
-
-Best regards,  
-AI Order Enquiry Assistant
-"""
+                            _, enquiry_message = render(
+                                "vendor_shipment_enquiry",
+                                order_id=order_id,
+                                customer_email=sender_email,
+                            )
                             send_vendor_email(
                                 vendor_email_input,
                                 product_name=f"Shipment Enquiry - Order {order_id}",
@@ -153,6 +252,36 @@ pending_updates = get_pending_vendor_updates()
 if not pending_updates:
     st.info("✅ No pending vendor updates for review.")
 else:
+    # BULK APPROVE / REJECT
+    pending_by_id = {v[0]: v for v in pending_updates}
+    with st.form("bulk_review_form"):
+        st.markdown("### 🗂 Bulk Review")
+        review_ids = st.multiselect(
+            "Vendor updates",
+            list(pending_by_id),
+            format_func=lambda rid: f"#{rid} — {pending_by_id[rid][9] or 'N/A'}",
+        )
+        col1, col2 = st.columns(2)
+        bulk_approve = col1.form_submit_button("✅ Approve Selected")
+        bulk_reject = col2.form_submit_button("❌ Reject Selected")
+
+        if (bulk_approve or bulk_reject) and not review_ids:
+            st.error("❌ Please select at least one vendor update.")
+        elif bulk_approve or bulk_reject:
+            is_approved = bool(bulk_approve)
+            template = "vendor_certificates_approved" if is_approved else "vendor_certificates_rejected"
+            outgoing = []
+            for rid in review_ids:
+                v = pending_by_id[rid]
+                customer_mailbox = v[-1] or mailbox_for("customer")
+                v = tuple(v) + (None,) * (15 - len(v))
+                vendor_subject, vendor_msg = render(template, record_id=rid)
+                outgoing.append((v[14] or v[1], vendor_subject, vendor_msg, mailbox_for("vendor")))
+                outgoing.append((v[1], *build_customer_update(v[9], v[10], approved=is_approved), customer_mailbox))
+
+            update_manager_decisions(review_ids, "Approved" if is_approved else "Rejected", outgoing=outgoing)
+            st.success(f"{'✅ Approved' if is_approved else '❌ Rejected'} {len(review_ids)} update(s); notifications queued.")
+
     for v in pending_updates:
         (
             record_id,
@@ -172,6 +301,7 @@ else:
             vendor_email,
             *rest
         ) = tuple(v) + (None,) * (15 - len(v))
+        record_mailbox = v[-1]
 
         display_email = vendor_email or sender_email
 
@@ -205,22 +335,16 @@ else:
             if col1.button(f"✅ Approve (Record {record_id})"):
                 update_manager_decision(record_id, "Approved")
 
-                vendor_msg = f"""Dear Vendor,
-
-We have reviewed the submitted food safety certificates for Record {record_id} and they are approved.
-Please proceed with shipment and provide tracking details/POD when available.
-
-Best regards,  
-AI Shipping Manager
-"""
+                vendor_subject, vendor_msg = render("vendor_certificates_approved", record_id=record_id)
                 try:
-                    send_email(display_email, f"Certificates Approved — Record {record_id}", vendor_msg)
+                    send_email(display_email, vendor_subject, vendor_msg, mailbox=mailbox_for("vendor"))
                     st.success("✅ Vendor notified about approval.")
                 except Exception as e:
                     st.error(f"Failed to send approval email to vendor: {e}")
 
                 try:
-                    send_customer_update(sender_email, vendor_status, payment_amount, approved=True)
+                    send_customer_update(sender_email, vendor_status, payment_amount, approved=True,
+                                         mailbox=record_mailbox)
                     st.success("✅ Customer updated about shipment approval.")
                 except Exception as e:
                     st.error(f"Failed to notify customer: {e}")
@@ -229,22 +353,35 @@ AI Shipping Manager
             if col2.button(f"❌ Reject (Record {record_id})"):
                 update_manager_decision(record_id, "Rejected")
 
-                vendor_msg = f"""Dear Vendor,
-
-After reviewing the submitted food safety certificates for Record {record_id}, we found them insufficient or invalid.
-Please resend valid food safety certificates (at least 2 valid PDFs) and include any missing shipment proof.
-
-Best regards,  
-AI Shipping Manager
-"""
+                vendor_subject, vendor_msg = render("vendor_certificates_rejected", record_id=record_id)
                 try:
-                    send_email(display_email, f"Certificates Rejected — Record {record_id}", vendor_msg)
+                    send_email(display_email, vendor_subject, vendor_msg, mailbox=mailbox_for("vendor"))
                     st.warning("❌ Vendor notified about rejection.")
                 except Exception as e:
                     st.error(f"Failed to send rejection email: {e}")
 
                 try:
-                    send_customer_update(sender_email, vendor_status, payment_amount, approved=False)
+                    send_customer_update(sender_email, vendor_status, payment_amount, approved=False,
+                                         mailbox=record_mailbox)
                     st.warning("❌ Customer informed about delay due to rejection.")
                 except Exception as e:
-                    st.error(f"Failed to notify customer: {e}")
\ No newline at end of file
+                    st.error(f"Failed to notify customer: {e}")
+
+
+# SECTION 3: Archive (opened only on demand)
+st.subheader("🗄 Archived Records")
+with st.form("archive_form"):
+    archive_sender = st.text_input("Customer Email (optional)", key="archive_sender")
+    if st.form_submit_button("📂 Load Archived Records"):
+        archived = get_archived_records(archive_sender.strip() or None)
+        if not archived:
+            st.info("No archived records found.")
+        for a in archived:
+            a = tuple(a) + (None,) * (15 - len(a))
+            with st.expander(f"🗄 Record #{a[0]} — {a[1]} — {a[11] or 'N/A'}"):
+                st.markdown("### 🧾 Customer Email")
+                st.write(a[2])
+                st.markdown("### 🤖 AI Reply Sent to Customer")
+                st.write(a[3])
+                st.write(f"- **Product:** {a[4] or 'N/A'}")
+                st.write(f"- **Vendor Status:** {a[9] or 'N/A'}")
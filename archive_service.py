@@ -0,0 +1,69 @@
+# archive_service.py
+import argparse
+import os
+import time
+import db_service
+from db_service import (
+    init_db,
+    migrate_inline_bodies,
+    train_body_dictionary,
+    recompress_bodies,
+    archive_decided_records,
+    get_all_records,
+    recompute_analytics,
+)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+
+def _db_size():
+    return os.path.getsize(db_service.DB_FILE) if os.path.exists(db_service.DB_FILE) else 0
+
+
+def _hot_query_ms(runs=5):
+    start = time.perf_counter()
+    for _ in range(runs):
+        get_all_records()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def vacuum():
+    conn = db_service._connect()
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def run_maintenance(days=ARCHIVE_AFTER_DAYS, retrain=False):
+    init_db()
+    size_before, latency_before = _db_size(), _hot_query_ms()
+
+    moved = migrate_inline_bodies()
+    print(f"🗜 Moved {moved} inline bodies to compressed storage.")
+
+    if retrain:
+        dict_id = train_body_dictionary()
+        recompress_bodies()
+        print(f"📚 Trained compression dictionary #{dict_id} and recompressed bodies.")
+
+    archived = archive_decided_records(days)
+    print(f"🗄 Archived {archived} decided record(s) older than {days} days.")
+
+    vacuum()
+    size_after, latency_after = _db_size(), _hot_query_ms()
+    print(f"💾 DB size: {size_before / 1e6:.1f} MB → {size_after / 1e6:.1f} MB")
+    print(f"⏱ get_all_records: {latency_before:.1f} ms → {latency_after:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DB maintenance: compress bodies, archive old records, repair analytics.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--retrain", action="store_true", help="train a new shared dictionary first")
+    parser.add_argument("--recompute-analytics", action="store_true",
+                        help="only rebuild the analytics summary tables from history")
+    args = parser.parse_args()
+    if args.recompute_analytics:
+        init_db()
+        recompute_analytics()
+        print("📊 Analytics summary tables rebuilt.")
+    else:
+        run_maintenance(args.days, args.retrain)
@@ -0,0 +1,120 @@
+# body_codec.py
+import struct
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:  # optional: falls back to zlib with a preset dictionary
+    zstandard = None
+
+# Blob layout: 1 byte codec + 2 bytes dictionary id (0 = none) + payload
+_HEADER = struct.Struct(">cH")
+RAW, ZLIB, ZSTD = b"r", b"z", b"s"
+
+MAX_DICT_SIZE = 32 * 1024   # zlib window size; also used for zstd dictionaries
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+# dict_id -> (codec, raw dictionary bytes); filled from the compression_dicts table
+_dictionaries = {}
+_active_dict_id = 0
+_zstd_dicts = {}
+_loader = None
+
+
+def register_dictionary(dict_id, codec, data, active=True):
+    global _active_dict_id
+    _dictionaries[dict_id] = (codec, data)
+    if codec == ZSTD and zstandard:
+        _zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+    if active and dict_id > _active_dict_id:
+        _active_dict_id = dict_id
+
+
+def has_dictionaries():
+    return bool(_dictionaries)
+
+
+def set_dictionary_loader(loader):
+    """loader(dict_id) -> (codec, data) or None, for dictionaries trained by another process."""
+    global _loader
+    _loader = loader
+
+
+def _dictionary(dict_id):
+    if dict_id not in _dictionaries and _loader:
+        found = _loader(dict_id)
+        if found:
+            register_dictionary(dict_id, *found)
+    return _dictionaries[dict_id]
+
+
+def train_dictionary(samples):
+    """
+    Build a shared dictionary from sample bodies. Returns: (codec, bytes)
+    zstd's trainer is used when available; otherwise the most frequent lines
+    (greetings, signatures, template text) are packed into a zlib preset
+    dictionary, most frequent last since zlib favours the nearest matches.
+    """
+    samples = [s.encode("utf-8") for s in samples if s]
+    if zstandard and len(samples) >= 10:
+        try:
+            trained = zstandard.train_dictionary(MAX_DICT_SIZE, samples)
+            return ZSTD, trained.as_bytes()
+        except zstandard.ZstdError:
+            pass  # too few / too small samples: fall back to zlib
+
+    counts = Counter(
+        line.strip() for s in samples for line in s.splitlines() if line.strip()
+    )
+    chunks, size = [], 0
+    for line, n in counts.most_common():
+        if n < 2 or size + len(line) + 1 > MAX_DICT_SIZE:
+            break
+        chunks.append(line + b"\n")
+        size += len(line) + 1
+    return ZLIB, b"".join(reversed(chunks))
+
+
+def compress_text(text):
+    if text is None:
+        return None
+    data = text.encode("utf-8")
+    dict_id = _active_dict_id
+    codec, zdict = _dictionaries.get(dict_id, (ZLIB, None))
+
+    if codec == ZSTD and dict_id in _zstd_dicts:
+        payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_zstd_dicts[dict_id]).compress(data)
+    else:
+        codec = ZLIB
+        if zdict:
+            c = zlib.compressobj(ZLIB_LEVEL, zdict=zdict)
+        else:
+            dict_id = 0
+            c = zlib.compressobj(ZLIB_LEVEL)
+        payload = c.compress(data) + c.flush()
+
+    # tiny bodies can grow; store those raw
+    if len(payload) >= len(data):
+        return _HEADER.pack(RAW, 0) + data
+    return _HEADER.pack(codec, dict_id) + payload
+
+
+def decompress_text(blob):
+    if blob is None:
+        return None
+    if isinstance(blob, str):  # legacy inline text
+        return blob
+    codec, dict_id = _HEADER.unpack_from(blob)
+    payload = bytes(blob[_HEADER.size:])
+
+    if codec == RAW:
+        data = payload
+    elif codec == ZSTD:
+        _dictionary(dict_id)
+        data = zstandard.ZstdDecompressor(dict_data=_zstd_dicts[dict_id]).decompress(payload)
+    else:
+        d = zlib.decompressobj(zdict=_dictionary(dict_id)[1]) if dict_id else zlib.decompressobj()
+        data = d.decompress(payload) + d.flush()
+    return data.decode("utf-8")
@@ -1,13 +1,34 @@
 import sqlite3
 import os
+import threading
+import time
+from body_codec import (
+    compress_text,
+    decompress_text,
+    has_dictionaries,
+    register_dictionary,
+    set_dictionary_loader,
+    train_dictionary,
+)
 
 DB_FILE = "emails.db"
+ARCHIVE_DB_FILE = "emails_archive.db"
+
+# Vendor follow-up timers created when an order is sent to a vendor (see scheduler_service)
+VENDOR_REMINDER_HOURS = float(os.getenv("VENDOR_REMINDER_HOURS", "24"))
+VENDOR_SLA_HOURS = float(os.getenv("VENDOR_SLA_HOURS", "72"))
+
+# How long a flush may hold claimed outbox rows before another sender can retry them
+OUTBOX_LEASE_SECONDS = 600
+
+# How long claimed Gmail message ids are remembered (see claim_message)
+PROCESSED_RETENTION_DAYS = 30
 
 
 # Initialize DB & safe columns
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
 
     # Main table
@@ -39,60 +60,681 @@ def init_db():
     if "vendor_email" not in columns:
         c.execute("ALTER TABLE emails ADD COLUMN vendor_email TEXT DEFAULT NULL")
 
+    # Outgoing mail queue (drained by outbox_service)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        to_email TEXT,
+        subject TEXT,
+        body TEXT,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT DEFAULT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent_at TIMESTAMP DEFAULT NULL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_unsent ON outbox(id) WHERE sent_at IS NULL")
+
+    # Small key/value state for push ingestion (last processed historyId, watch expiry)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """)
+    # Gmail messages already taken by a push sync or a poller (see claim_message)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS processed_messages (
+        gmail_id TEXT PRIMARY KEY,
+        mailbox TEXT,
+        claimed_at INTEGER
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_processed_messages_claimed ON processed_messages(claimed_at)")
+
+    # Repeat copies of the same email collapsed into this record
+    if "duplicate_count" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN duplicate_count INTEGER DEFAULT 0")
+
+    # Near-duplicate index (see dedup_service): MinHash signature + LSH band buckets
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS email_signatures (
+        record_id INTEGER PRIMARY KEY,
+        signature BLOB,
+        numbers TEXT
+    )
+    """)
+    # numbers in the body (order IDs, quantities): near-duplicates must agree on them exactly
+    signature_columns = [row[1] for row in c.execute("PRAGMA table_info(email_signatures);")]
+    if "numbers" not in signature_columns:
+        c.execute("ALTER TABLE email_signatures ADD COLUMN numbers TEXT DEFAULT NULL")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS email_lsh (
+        bucket INTEGER,
+        sender TEXT,
+        created_at INTEGER,
+        record_id INTEGER
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_email_lsh ON email_lsh(bucket, sender, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_email_lsh_created ON email_lsh(created_at)")  # pruning
+
+    # Compressed bodies live in email_bodies; emails.email_text/reply_text are
+    # only set transiently on insert (and on rows not yet migrated)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS email_bodies (
+        record_id INTEGER PRIMARY KEY,
+        email_text BLOB,
+        reply_text BLOB
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS compression_dicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codec TEXT,
+        data BLOB,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    if "decided_at" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN decided_at TIMESTAMP DEFAULT NULL")
+
+    # Conversation tracking: follow-ups in the same Gmail thread merge into one record
+    if "order_id" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN order_id TEXT DEFAULT NULL")
+    if "thread_id" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN thread_id TEXT DEFAULT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_thread_id ON emails(thread_id)")
+
+    # Canonical catalog SKU resolved from the free-text product name
+    if "sku" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN sku TEXT DEFAULT NULL")
+
+    # Event timestamps (set explicitly: ALTER TABLE can't add CURRENT_TIMESTAMP defaults)
+    for col in ("created_at", "vendor_requested_at", "vendor_replied_at"):
+        if col not in columns:
+            c.execute(f"ALTER TABLE emails ADD COLUMN {col} TIMESTAMP DEFAULT NULL")
+
+    # Intent from intent_classifier; source 'gemini'/'manager' rows are used as training labels
+    for col in ("intent", "intent_source"):
+        if col not in columns:
+            c.execute(f"ALTER TABLE emails ADD COLUMN {col} TEXT DEFAULT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_intent_source ON emails(intent_source) WHERE intent_source IS NOT NULL")
+
+    # Gmail account (mailboxes.py) the record came in through; outbox rows are sent from one too
+    if "mailbox" not in columns:
+        c.execute("ALTER TABLE emails ADD COLUMN mailbox TEXT DEFAULT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_mailbox ON emails(mailbox)")
+    outbox_columns = [row[1] for row in c.execute("PRAGMA table_info(outbox);")]
+    if "mailbox" not in outbox_columns:
+        c.execute("ALTER TABLE outbox ADD COLUMN mailbox TEXT DEFAULT NULL")
+    # lease taken by the sender working on a row (unix time it expires), see claim_unsent_emails
+    if "claimed_until" not in outbox_columns:
+        c.execute("ALTER TABLE outbox ADD COLUMN claimed_until INTEGER DEFAULT NULL")
+
+    stale_stats = _init_analytics(c)
+    _init_timers(c)
+
+    # Full-text search over emails (external-content FTS5 over the emails_full
+    # view, kept in sync by triggers)
+    fts_sql = c.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'"
+    ).fetchone()
+    if fts_sql and "content='emails_full'" not in fts_sql[0]:
+        # index built against inline bodies: recreate over the view
+        for trigger in ("emails_fts_ai", "emails_fts_ad", "emails_fts_au"):
+            c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        c.execute("DROP TABLE emails_fts")
+        fts_sql = None
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+        email_text, reply_text, product_name, sender_email,
+        content='emails_full', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts (rowid, email_text, reply_text, product_name, sender_email)
+        VALUES (new.id, new.email_text, new.reply_text, new.product_name, new.sender_email);
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, email_text, reply_text, product_name, sender_email)
+        SELECT 'delete', old.id,
+               COALESCE(old.email_text, body_text(b.email_text)),
+               COALESCE(old.reply_text, body_text(b.reply_text)),
+               old.product_name, old.sender_email
+        FROM (SELECT 1) LEFT JOIN email_bodies b ON b.record_id = old.id;
+        DELETE FROM email_bodies WHERE record_id = old.id;
+    END
+    """)
+    # Bodies moving out of the emails row don't change the indexed text, so only
+    # product/sender updates re-index
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS emails_fts_au
+    AFTER UPDATE OF product_name, sender_email ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, email_text, reply_text, product_name, sender_email)
+        SELECT 'delete', old.id, v.email_text, v.reply_text, old.product_name, old.sender_email
+        FROM emails_full v WHERE v.id = new.id;
+        INSERT INTO emails_fts (rowid, email_text, reply_text, product_name, sender_email)
+        SELECT v.id, v.email_text, v.reply_text, v.product_name, v.sender_email
+        FROM emails_full v WHERE v.id = new.id;
+    END
+    """)
+
+    # Facet filters used by the dashboard search
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_vendor_status ON emails(vendor_status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_manager_decision ON emails(manager_decision)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_vendor_email ON emails(vendor_email)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_decided_at ON emails(decided_at) WHERE manager_decision IS NOT NULL")
+
+    # emails with bodies decompressed, same column order as emails (SELECT * compatible)
+    _create_full_view(c)
+    if not fts_sql:
+        c.execute("INSERT INTO emails_fts (emails_fts) VALUES ('rebuild')")
+
     conn.commit()
     conn.close()
 
+    # existing history has to be counted once before the triggers take over
+    if stale_stats:
+        recompute_analytics()
 
 
-# Insert a new email record
+def _init_analytics(c):
+    """
+    Summary tables for the analytics tiles, maintained incrementally by triggers.
+    Returns: True when the summary tables need a backfill (new, or order counting changed)
+    """
+    insert_sql = c.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'stats_email_insert'"
+    ).fetchone()
+    stale = insert_sql is None or "intent" not in insert_sql[0]
+    if stale:
+        c.execute("DROP TRIGGER IF EXISTS stats_email_insert")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT PRIMARY KEY,
+        orders INTEGER DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_vendor (
+        vendor_email TEXT PRIMARY KEY,
+        pending INTEGER DEFAULT 0,
+        reminders INTEGER DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_totals (
+        name TEXT PRIMARY KEY,
+        value REAL DEFAULT 0
+    )
+    """)
+    # Reminders aren't derivable from emails, so they are logged as events
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS reminder_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        record_id INTEGER,
+        vendor_email TEXT,
+        kind TEXT,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Only order emails count; shipping/cancellation/complaint mail is not an order
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_email_insert AFTER INSERT ON emails
+    WHEN new.intent = 'order' BEGIN
+        INSERT INTO stats_daily (day, orders) VALUES (date(COALESCE(new.created_at, 'now')), 1)
+        ON CONFLICT(day) DO UPDATE SET orders = orders + 1;
+    END
+    """)
+    # Manager relabels (intent_classifier --label) move a record in or out of the count
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_email_intent
+    AFTER UPDATE OF intent ON emails
+    WHEN new.created_at IS NOT NULL AND (old.intent = 'order') IS NOT (new.intent = 'order') BEGIN
+        UPDATE stats_daily SET orders = orders - 1
+        WHERE day = date(old.created_at) AND old.intent = 'order';
+        INSERT INTO stats_daily (day, orders)
+        SELECT date(new.created_at), 1 WHERE new.intent = 'order'
+        ON CONFLICT(day) DO UPDATE SET orders = orders + 1;
+    END
+    """)
+    # A record is "pending vendor reply" while approved + sent to a vendor + no vendor status
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_vendor_pending
+    AFTER UPDATE OF approved, vendor_email, vendor_status ON emails BEGIN
+        UPDATE stats_vendor SET pending = pending - 1
+        WHERE vendor_email = old.vendor_email
+          AND old.approved = 1 AND old.vendor_status IS NULL;
+        INSERT INTO stats_vendor (vendor_email, pending)
+        SELECT new.vendor_email, 1
+        WHERE new.approved = 1 AND new.vendor_status IS NULL AND new.vendor_email IS NOT NULL
+        ON CONFLICT(vendor_email) DO UPDATE SET pending = pending + 1;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_vendor_confirmed
+    AFTER UPDATE OF vendor_replied_at ON emails
+    WHEN old.vendor_replied_at IS NULL AND new.vendor_replied_at IS NOT NULL
+         AND new.created_at IS NOT NULL BEGIN
+        INSERT INTO stats_totals (name, value) VALUES ('confirmations', 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_totals (name, value)
+        VALUES ('confirmation_seconds', (julianday(new.vendor_replied_at) - julianday(new.created_at)) * 86400)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_decision
+    AFTER UPDATE OF manager_decision ON emails
+    WHEN old.manager_decision IS NOT new.manager_decision BEGIN
+        UPDATE stats_totals SET value = value - 1
+        WHERE name = 'decision:' || old.manager_decision;
+        INSERT INTO stats_totals (name, value)
+        SELECT 'decision:' || new.manager_decision, 1 WHERE new.manager_decision IS NOT NULL
+        ON CONFLICT(name) DO UPDATE SET value = value + 1;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS stats_reminder AFTER INSERT ON reminder_log BEGIN
+        INSERT INTO stats_totals (name, value) VALUES ('reminders:' || new.kind, 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_vendor (vendor_email, reminders) SELECT new.vendor_email, 1
+        WHERE new.vendor_email IS NOT NULL
+        ON CONFLICT(vendor_email) DO UPDATE SET reminders = reminders + 1;
+    END
+    """)
+    return stale
+
+
+def _init_timers(c):
+    """Persistent due-time index for scheduler_service, fed/cancelled by triggers."""
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS timers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        record_id INTEGER,
+        kind TEXT,
+        due_at INTEGER,
+        attempt INTEGER DEFAULT 1,
+        done INTEGER DEFAULT 0
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_timers_due ON timers(due_at) WHERE done = 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_timers_record ON timers(record_id) WHERE done = 0")
+
+    # Hours are baked into the trigger; recreate it so env changes apply
+    c.execute("DROP TRIGGER IF EXISTS timers_on_vendor_request")
+    c.execute(f"""
+    CREATE TRIGGER timers_on_vendor_request
+    AFTER UPDATE OF vendor_requested_at ON emails
+    WHEN old.vendor_requested_at IS NULL AND new.vendor_requested_at IS NOT NULL
+         AND new.vendor_status IS NULL BEGIN
+        INSERT INTO timers (record_id, kind, due_at) VALUES
+            (new.id, 'vendor_reminder', CAST(strftime('%s', 'now') AS INTEGER) + {int(VENDOR_REMINDER_HOURS * 3600)}),
+            (new.id, 'sla_escalation', CAST(strftime('%s', 'now') AS INTEGER) + {int(VENDOR_SLA_HOURS * 3600)});
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS timers_on_vendor_reply
+    AFTER UPDATE OF vendor_replied_at ON emails
+    WHEN new.vendor_replied_at IS NOT NULL BEGIN
+        UPDATE timers SET done = 1 WHERE record_id = new.id AND done = 0;
+    END
+    """)
 
-def insert_record(sender, email_text, reply_text, product_name, price, quantity, ready):
+
+def _create_full_view(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(emails);")]
+    select = ", ".join(
+        f"COALESCE(e.{col}, body_text(b.{col})) AS {col}" if col in ("email_text", "reply_text") else f"e.{col}"
+        for col in columns
+    )
+    c.execute("DROP VIEW IF EXISTS emails_full")
+    c.execute(f"""
+        CREATE VIEW emails_full AS
+        SELECT {select} FROM emails e LEFT JOIN email_bodies b ON b.record_id = e.id
+    """)
+
+
+def _connect():
+    """Open the DB with the body_text() SQL function and compression dictionaries loaded."""
+    conn = sqlite3.connect(DB_FILE)
+    conn.create_function("body_text", 1, decompress_text, deterministic=True)
+    if not has_dictionaries():
+        try:
+            for dict_id, codec, data in conn.execute("SELECT id, codec, data FROM compression_dicts"):
+                register_dictionary(dict_id, codec.encode(), data)
+        except sqlite3.OperationalError:
+            pass  # before init_db
+    return conn
+
+
+def _load_dictionary(dict_id):
+    """Fetch a dictionary trained after this process loaded the table (see body_codec)."""
     conn = sqlite3.connect(DB_FILE)
+    row = conn.execute("SELECT codec, data FROM compression_dicts WHERE id = ?", (dict_id,)).fetchone()
+    conn.close()
+    return (row[0].encode(), row[1]) if row else None
+
+
+set_dictionary_loader(_load_dictionary)
+
+
+def _store_body(conn, record_id):
+    """Move a row's inline bodies into email_bodies (compressed)."""
+    row = conn.execute(
+        "SELECT email_text, reply_text FROM emails WHERE id = ?", (record_id,)
+    ).fetchone()
+    if row is None:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO email_bodies (record_id, email_text, reply_text) VALUES (?, ?, ?)",
+        (record_id, compress_text(row[0]), compress_text(row[1])),
+    )
+    conn.execute("UPDATE emails SET email_text = NULL, reply_text = NULL WHERE id = ?", (record_id,))
+
+
+
+# Insert a new email record
+
+def insert_record(sender, email_text, reply_text, product_name, price, quantity, ready,
+                  order_id=None, thread_id=None, sku=None, intent=None, intent_source=None, mailbox=None):
+    conn = _connect()
     c = conn.cursor()
     c.execute("""
     INSERT INTO emails (
-        sender_email, email_text, reply_text, product_name, price, quantity, ready_for_approval
-    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (sender, email_text, reply_text, product_name, price, quantity, ready))
+        sender_email, email_text, reply_text, product_name, price, quantity, ready_for_approval,
+        order_id, thread_id, sku, intent, intent_source, mailbox, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (sender, email_text, reply_text, product_name, price, quantity, ready, order_id, thread_id, sku,
+          intent, intent_source, mailbox))
+    record_id = c.lastrowid
+    _store_body(conn, record_id)
     conn.commit()
     conn.close()
+    return record_id
+
+
+
+# Conversations (Gmail threads)
+
+def find_record_by_thread(thread_id):
+    """Returns: dict of the latest record's id + extracted details for a thread, or None"""
+    if not thread_id:
+        return None
+    conn = _connect()
+    row = conn.execute("""
+        SELECT id, order_id, product_name, price, quantity, sku FROM emails
+        WHERE thread_id = ? ORDER BY id DESC LIMIT 1
+    """, (thread_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return dict(zip(("id", "order_id", "product_name", "price", "quantity", "sku"), row))
+
+
+def merge_into_record(record_id, details, email_text, reply_text, ready):
+    """
+    Fold a follow-up message into an existing record: newly extracted fields
+    fill in or replace the stored ones, and the texts are appended.
+    """
+    conn = _connect()
+    with conn:
+        old = conn.execute(
+            "SELECT email_text, reply_text, product_name, sender_email FROM emails_full WHERE id = ?",
+            (record_id,),
+        ).fetchone()
+        if old is None:
+            conn.close()
+            return
+        new_email = "\n\n--- Follow-up ---\n".join(t for t in (old[0], email_text) if t)
+        new_reply = "\n\n--- Follow-up ---\n".join(t for t in (old[1], reply_text) if t)
+
+        # bodies live outside the emails row, so re-index them here (product/sender
+        # changes are handled by the emails_fts_au trigger below)
+        conn.execute("""
+            INSERT INTO emails_fts (emails_fts, rowid, email_text, reply_text, product_name, sender_email)
+            VALUES ('delete', ?, ?, ?, ?, ?)
+        """, (record_id, *old))
+        conn.execute(
+            "INSERT OR REPLACE INTO email_bodies (record_id, email_text, reply_text) VALUES (?, ?, ?)",
+            (record_id, compress_text(new_email), compress_text(new_reply)),
+        )
+        conn.execute("""
+            INSERT INTO emails_fts (rowid, email_text, reply_text, product_name, sender_email)
+            VALUES (?, ?, ?, ?, ?)
+        """, (record_id, new_email, new_reply, old[2], old[3]))
+
+        conn.execute("""
+            UPDATE emails
+            SET email_text = NULL, reply_text = NULL,
+                order_id = COALESCE(?, order_id),
+                product_name = COALESCE(?, product_name),
+                price = COALESCE(?, price),
+                quantity = COALESCE(?, quantity),
+                sku = COALESCE(?, sku),
+                ready_for_approval = ?
+            WHERE id = ?
+        """, (
+            details.get("order_id"),
+            details.get("product_name"),
+            details.get("price"),
+            details.get("quantity"),
+            details.get("sku"),
+            ready,
+            record_id,
+        ))
+    conn.close()
+
+
+
+# Near-duplicate index
+
+_index_local = threading.local()
+
+
+def _index_conn():
+    """Per-thread connection for the dedup index: opening one costs more than the lookup itself."""
+    if getattr(_index_local, "db_file", None) != DB_FILE:
+        _index_local.conn = _connect()
+        _index_local.db_file = DB_FILE
+    return _index_local.conn
+
+
+def save_signature(record_id, sender, created_at, signature, buckets, numbers=None):
+    conn = _index_conn()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO email_signatures (record_id, signature, numbers) VALUES (?, ?, ?)",
+            (record_id, signature, numbers),
+        )
+        conn.executemany(
+            "INSERT INTO email_lsh (bucket, sender, created_at, record_id) VALUES (?, ?, ?, ?)",
+            [(b, sender, created_at, record_id) for b in buckets],
+        )
+
+
+def find_lsh_candidates(sender, buckets, since, numbers):
+    """Returns: [(record_id, signature)] sharing at least one LSH bucket with `buckets` and the same numbers."""
+    placeholders = ",".join("?" * len(buckets))
+    return _index_conn().execute(f"""
+        SELECT DISTINCT s.record_id, s.signature
+        FROM email_lsh l JOIN email_signatures s ON s.record_id = l.record_id
+        WHERE l.bucket IN ({placeholders}) AND l.sender = ? AND l.created_at >= ? AND s.numbers = ?
+    """, (*buckets, sender, since, numbers)).fetchall()
+
+
+def prune_signatures(before):
+    """Drop index rows created before `before` (unix time); lookups never reach them. Returns: LSH rows removed"""
+    conn = _index_conn()
+    with conn:
+        conn.execute(
+            "DELETE FROM email_signatures WHERE record_id IN (SELECT record_id FROM email_lsh WHERE created_at < ?)",
+            (before,),
+        )
+        removed = conn.execute("DELETE FROM email_lsh WHERE created_at < ?", (before,)).rowcount
+    return removed
+
+
+def mark_duplicate(record_id):
+    """Returns: False if the record no longer exists (e.g. archived)"""
+    conn = _index_conn()
+    with conn:
+        updated = conn.execute(
+            "UPDATE emails SET duplicate_count = COALESCE(duplicate_count, 0) + 1 WHERE id = ?",
+            (record_id,),
+        ).rowcount
+    return bool(updated)
 
 
 
 # Fetch all records
 
+# Record listings end with order_id and mailbox again, so the dashboard can read
+# them by position whatever order upgrades added the columns in
+RECORD_COLUMNS = "e.*, e.order_id, e.mailbox"
+
+
 def get_all_records():
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
-    c.execute("SELECT * FROM emails ORDER BY id DESC")
+    c.execute(f"SELECT {RECORD_COLUMNS} FROM emails_full e ORDER BY e.id DESC")
     rows = c.fetchall()
     conn.close()
     return rows
 
 
 
+# Full-text search with facet filters
+
+def _fts_query(text):
+    """Quote each term so user input can't break FTS5 syntax; last term is a prefix match."""
+    terms = ['"' + t.replace('"', '""') + '"' for t in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_records(query="", status=None, decision=None, vendor=None, mailbox=None, limit=100):
+    """
+    Ranked (bm25) search over email/reply text, product name and sender.
+    decision="Pending" matches records without a manager decision.
+    """
+    where, params = [], []
+    if status:
+        where.append("e.vendor_status = ?")
+        params.append(status)
+    if decision == "Pending":
+        where.append("e.manager_decision IS NULL")
+    elif decision:
+        where.append("e.manager_decision = ?")
+        params.append(decision)
+    if vendor:
+        where.append("e.vendor_email = ?")
+        params.append(vendor)
+    if mailbox:
+        where.append("e.mailbox = ?")
+        params.append(mailbox)
+
+    conn = _connect()
+    c = conn.cursor()
+    if query.strip():
+        sql = f"""
+            SELECT {RECORD_COLUMNS} FROM emails_fts JOIN emails_full e ON e.id = emails_fts.rowid
+            WHERE emails_fts MATCH ?
+        """
+        sql += "".join(f" AND {w}" for w in where)
+        sql += " ORDER BY bm25(emails_fts) LIMIT ?"
+        c.execute(sql, (_fts_query(query), *params, limit))
+    else:
+        sql = f"SELECT {RECORD_COLUMNS} FROM emails_full e"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY e.id DESC LIMIT ?"
+        c.execute(sql, (*params, limit))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+
+def get_facet_values():
+    """Returns: {"status": [...], "decision": [...], "vendor": [...], "mailbox": [...]} for the search filters."""
+    conn = _connect()
+    c = conn.cursor()
+    facets = {}
+    for name, column in (
+        ("status", "vendor_status"),
+        ("decision", "manager_decision"),
+        ("vendor", "vendor_email"),
+        ("mailbox", "mailbox"),
+    ):
+        # Loose index scan: one index seek per distinct value instead of a full scan
+        c.execute(f"""
+            WITH RECURSIVE v(val) AS (
+                SELECT MIN({column}) FROM emails
+                UNION ALL
+                SELECT (SELECT MIN({column}) FROM emails WHERE {column} > v.val) FROM v
+                WHERE v.val IS NOT NULL
+            )
+            SELECT val FROM v WHERE val IS NOT NULL
+        """)
+        facets[name] = [row[0] for row in c.fetchall()]
+    conn.close()
+    return facets
+
+
+
 # Mark as approved
 
 def mark_as_approved(record_id, vendor_email=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
     if vendor_email:
-        c.execute("UPDATE emails SET approved = 1, vendor_email = ? WHERE id = ?", (vendor_email, record_id))
+        c.execute("""
+            UPDATE emails SET approved = 1, vendor_email = ?, vendor_requested_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (vendor_email, record_id))
     else:
         c.execute("UPDATE emails SET approved = 1 WHERE id = ?", (record_id,))
     conn.commit()
     conn.close()
 
 
+# Bulk approve in one transaction, optionally queueing outgoing mail
+
+def mark_many_as_approved(record_ids, vendor_email=None, outgoing=None):
+    conn = _connect()
+    with conn:
+        if vendor_email:
+            conn.executemany(
+                "UPDATE emails SET approved = 1, vendor_email = ?, vendor_requested_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(vendor_email, rid) for rid in record_ids],
+            )
+        else:
+            conn.executemany(
+                "UPDATE emails SET approved = 1 WHERE id = ?",
+                [(rid,) for rid in record_ids],
+            )
+        if outgoing:
+            _enqueue(conn, outgoing)
+    conn.close()
+
+
 # Update vendor info by record ID
 
 def save_vendor_update(record_id, vendor_status, payment_amount, pdf1_path=None, pdf2_path=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
     c.execute("""
         UPDATE emails
         SET vendor_status = ?, payment_amount = ?, ready_for_approval = 1,
-            vendor_pdf1 = ?, vendor_pdf2 = ?
+            vendor_pdf1 = ?, vendor_pdf2 = ?,
+            vendor_replied_at = COALESCE(vendor_replied_at, CURRENT_TIMESTAMP)
         WHERE id = ?
     """, (vendor_status, payment_amount, pdf1_path, pdf2_path, record_id))
     conn.commit()
@@ -103,16 +745,25 @@ def save_vendor_update(record_id, vendor_status, payment_amount, pdf1_path=None,
 # Update vendor info by sender email (or most recent unmatched record)
 
 def update_vendor_reply(sender_email, vendor_status, payment_amount, pdf1_path=None, pdf2_path=None, vendor_email=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
 
+    # Prefer the record this vendor was actually asked about
     c.execute("""
         SELECT id FROM emails
-        WHERE sender_email = ? AND vendor_status IS NULL
+        WHERE vendor_email = ? AND vendor_status IS NULL
         ORDER BY id DESC LIMIT 1
-    """, (sender_email,))
+    """, (vendor_email or sender_email,))
     row = c.fetchone()
 
+    if not row:
+        c.execute("""
+            SELECT id FROM emails
+            WHERE sender_email = ? AND vendor_status IS NULL
+            ORDER BY id DESC LIMIT 1
+        """, (sender_email,))
+        row = c.fetchone()
+
     if not row:
         c.execute("""
             SELECT id FROM emails
@@ -128,7 +779,8 @@ def update_vendor_reply(sender_email, vendor_status, payment_amount, pdf1_path=N
             SET vendor_status = ?, payment_amount = ?, ready_for_approval = 1,
                 vendor_pdf1 = COALESCE(?, vendor_pdf1),
                 vendor_pdf2 = COALESCE(?, vendor_pdf2),
-                vendor_email = COALESCE(?, vendor_email)
+                vendor_email = COALESCE(?, vendor_email),
+                vendor_replied_at = COALESCE(vendor_replied_at, CURRENT_TIMESTAMP)
             WHERE id = ?
         """, (vendor_status, payment_amount, pdf1_path, pdf2_path, vendor_email, record_id))
 
@@ -141,11 +793,11 @@ def update_vendor_reply(sender_email, vendor_status, payment_amount, pdf1_path=N
 # Manager decision
 
 def update_manager_decision(record_id, decision):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
     c.execute("""
         UPDATE emails
-        SET manager_decision = ?
+        SET manager_decision = ?, decided_at = CURRENT_TIMESTAMP
         WHERE id = ?
     """, (decision, record_id))
     conn.commit()
@@ -153,22 +805,475 @@ def update_manager_decision(record_id, decision):
 
 
 
+# Bulk manager decision in one transaction, optionally queueing outgoing mail
+
+def update_manager_decisions(record_ids, decision, outgoing=None):
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "UPDATE emails SET manager_decision = ?, decided_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [(decision, rid) for rid in record_ids],
+        )
+        if outgoing:
+            _enqueue(conn, outgoing)
+    conn.close()
+
+
+
+# Outbox: queued outgoing emails as (to, subject, body)
+
+def _enqueue(conn, messages, mailbox=None):
+    """messages: (to, subject, body) or (to, subject, body, mailbox) to override `mailbox` per message"""
+    conn.executemany(
+        "INSERT INTO outbox (to_email, subject, body, mailbox) VALUES (?, ?, ?, ?)",
+        [(*m[:3], m[3] if len(m) > 3 else mailbox) for m in messages],
+    )
+
+
+def enqueue_emails(messages, mailbox=None):
+    conn = _connect()
+    with conn:
+        _enqueue(conn, messages, mailbox)
+    conn.close()
+
+
+def claim_unsent_emails(limit=50, max_attempts=5, lease_seconds=OUTBOX_LEASE_SECONDS):
+    """
+    Lease up to `limit` unsent rows to the caller in one UPDATE, so concurrent
+    flushes (app, scheduler, mailbox workers) never pick the same row.
+    A lease left behind by a crashed sender expires after lease_seconds.
+    Returns: [(id, to_email, subject, body, mailbox)]
+    """
+    now = int(time.time())
+    conn = _connect()
+    with conn:
+        rows = conn.execute("""
+            UPDATE outbox SET claimed_until = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE sent_at IS NULL AND attempts < ?
+                  AND (claimed_until IS NULL OR claimed_until < ?)
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, to_email, subject, body, mailbox
+        """, (now + lease_seconds, max_attempts, now, limit)).fetchall()
+    conn.close()
+    return sorted(rows)  # RETURNING order is unspecified
+
+
+def mark_outbox_results(sent_ids, failed):
+    """failed: list of (outbox_id, error_text)"""
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "UPDATE outbox SET sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1, claimed_until = NULL WHERE id = ?",
+            [(oid,) for oid in sent_ids],
+        )
+        conn.executemany(
+            "UPDATE outbox SET last_error = ?, attempts = attempts + 1, claimed_until = NULL WHERE id = ?",
+            [(err, oid) for oid, err in failed],
+        )
+    conn.close()
+
+
+
 # Fetch vendor updates pending manager approval
 
 def get_pending_vendor_updates():
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     c = conn.cursor()
-    c.execute("""
-        SELECT * FROM emails
-        WHERE vendor_status IS NOT NULL
-          AND manager_decision IS NULL
-        ORDER BY id DESC
+    c.execute(f"""
+        SELECT {RECORD_COLUMNS} FROM emails_full e
+        WHERE e.vendor_status IS NOT NULL
+          AND e.manager_decision IS NULL
+        ORDER BY e.id DESC
     """)
     rows = c.fetchall()
     conn.close()
     return rows
 
 
+# Analytics (summary tables kept current by triggers, see _init_analytics)
+
+def log_reminder(vendor_email, kind="certificates", record_id=None):
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO reminder_log (record_id, vendor_email, kind) VALUES (?, ?, ?)",
+            (record_id, vendor_email, kind),
+        )
+    conn.close()
+
+
+def get_analytics(days=30):
+    """Read the dashboard tiles from the summary tables (cost independent of history size)."""
+    conn = _connect()
+    totals = dict(conn.execute("SELECT name, value FROM stats_totals").fetchall())
+    daily = conn.execute(
+        "SELECT day, orders FROM stats_daily WHERE day >= date('now', ?) ORDER BY day",
+        (f"-{int(days)} days",),
+    ).fetchall()
+    vendors = conn.execute("""
+        SELECT vendor_email, pending, reminders FROM stats_vendor
+        WHERE pending > 0 OR reminders > 0
+        ORDER BY pending DESC, reminders DESC LIMIT 50
+    """).fetchall()
+    conn.close()
+
+    confirmations = totals.get("confirmations", 0)
+    approved = totals.get("decision:Approved", 0)
+    rejected = totals.get("decision:Rejected", 0)
+    decided = approved + rejected
+    return {
+        "orders_per_day": daily,
+        "pending_by_vendor": vendors,
+        "avg_confirmation_hours": (
+            totals.get("confirmation_seconds", 0) / confirmations / 3600 if confirmations else None
+        ),
+        "approved": int(approved),
+        "rejected": int(rejected),
+        "approval_rate": approved / decided if decided else None,
+        "certificate_reminders": int(totals.get("reminders:certificates", 0)),
+    }
+
+
+def recompute_analytics():
+    """Rebuild all summary tables from emails (+ archive) and reminder_log, e.g. after repairs."""
+    conn = _connect()
+    has_archive = os.path.exists(ARCHIVE_DB_FILE)
+    if has_archive:
+        conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_FILE,))
+        _init_archive(conn)
+        history = """(
+            SELECT created_at, vendor_replied_at, manager_decision, intent FROM main.emails
+            UNION ALL
+            SELECT created_at, vendor_replied_at, manager_decision, intent FROM archive.emails
+        )"""
+    else:
+        history = "main.emails"
+
+    with conn:
+        conn.execute("DELETE FROM stats_daily")
+        conn.execute(f"""
+            INSERT INTO stats_daily (day, orders)
+            SELECT date(created_at), COUNT(*) FROM {history}
+            WHERE created_at IS NOT NULL AND intent = 'order' GROUP BY date(created_at)
+        """)
+
+        conn.execute("DELETE FROM stats_vendor")
+        conn.execute("""
+            INSERT INTO stats_vendor (vendor_email, pending)
+            SELECT vendor_email, COUNT(*) FROM main.emails
+            WHERE approved = 1 AND vendor_status IS NULL AND vendor_email IS NOT NULL
+            GROUP BY vendor_email
+        """)
+        conn.execute("""
+            INSERT INTO stats_vendor (vendor_email, reminders)
+            SELECT vendor_email, COUNT(*) FROM reminder_log
+            WHERE vendor_email IS NOT NULL GROUP BY vendor_email
+            ON CONFLICT(vendor_email) DO UPDATE SET reminders = excluded.reminders
+        """)
+
+        conn.execute("DELETE FROM stats_totals")
+        conn.execute(f"""
+            INSERT INTO stats_totals (name, value)
+            SELECT 'confirmations', COUNT(*) FROM {history}
+            WHERE vendor_replied_at IS NOT NULL AND created_at IS NOT NULL
+            UNION ALL
+            SELECT 'confirmation_seconds',
+                   COALESCE(SUM((julianday(vendor_replied_at) - julianday(created_at)) * 86400), 0)
+            FROM {history}
+            WHERE vendor_replied_at IS NOT NULL AND created_at IS NOT NULL
+            UNION ALL
+            SELECT 'decision:' || manager_decision, COUNT(*) FROM {history}
+            WHERE manager_decision IS NOT NULL GROUP BY manager_decision
+            UNION ALL
+            SELECT 'reminders:' || kind, COUNT(*) FROM reminder_log GROUP BY kind
+        """)
+    if has_archive:
+        conn.execute("DETACH DATABASE archive")
+    conn.close()
+
+
+
+# Timers (scheduler_service)
+
+def get_timers_after(last_id, limit=1000):
+    """Pending timers with id > last_id (PK range, so polling never scans the table)."""
+    conn = _connect()
+    rows = conn.execute("""
+        SELECT id, record_id, kind, due_at, attempt FROM timers
+        WHERE id > ? AND done = 0 ORDER BY id LIMIT ?
+    """, (last_id, limit)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_max_timer_id():
+    conn = _connect()
+    row = conn.execute("SELECT MAX(id) FROM timers").fetchone()
+    conn.close()
+    return row[0] or 0
+
+
+def get_pending_timers():
+    """All pending timers, read once at scheduler start via the due_at index."""
+    conn = _connect()
+    rows = conn.execute("""
+        SELECT id, record_id, kind, due_at, attempt FROM timers
+        WHERE done = 0 ORDER BY due_at
+    """).fetchall()
+    conn.close()
+    return rows
+
+
+def fire_timer(timer_id, messages, reminder=None, follow_up=None):
+    """
+    Claim a due timer and, in the same transaction, queue its emails, log the
+    reminder and schedule the follow-up timer, so a failure leaves the timer pending.
+    reminder: (vendor_email, kind, record_id); follow_up: (record_id, kind, due_at, attempt)
+    Returns: (claimed, follow-up timer id or None); claimed is False if the timer
+    was already done/cancelled, in which case nothing is written.
+    """
+    conn = _connect()
+    follow_up_id = None
+    with conn:
+        claimed = conn.execute(
+            "UPDATE timers SET done = 1 WHERE id = ? AND done = 0", (timer_id,)
+        ).rowcount
+        if claimed:
+            _enqueue(conn, messages)
+            if reminder:
+                conn.execute(
+                    "INSERT INTO reminder_log (vendor_email, kind, record_id) VALUES (?, ?, ?)", reminder
+                )
+            if follow_up:
+                record_id, kind, due_at, attempt = follow_up
+                follow_up_id = conn.execute(
+                    "INSERT INTO timers (record_id, kind, due_at, attempt) VALUES (?, ?, ?, ?)",
+                    (record_id, kind, int(due_at), attempt),
+                ).lastrowid
+    conn.close()
+    return bool(claimed), follow_up_id
+
+
+def get_record(record_id):
+    """Returns: dict of one record (bodies decompressed) or None"""
+    conn = _connect()
+    c = conn.execute("SELECT * FROM emails_full WHERE id = ?", (record_id,))
+    row = c.fetchone()
+    names = [d[0] for d in c.description]
+    conn.close()
+    return dict(zip(names, row)) if row else None
+
+
+
+# Intent labels (intent_classifier)
+
+def get_intent_training_rows(limit=20000):
+    """Returns: [(email_text, intent)] for records labeled by Gemini or a manager, newest first"""
+    conn = _connect()
+    rows = conn.execute("""
+        SELECT email_text, intent FROM emails_full
+        WHERE intent_source IN ('gemini', 'manager') AND intent IS NOT NULL
+        ORDER BY id DESC LIMIT ?
+    """, (limit,)).fetchall()
+    conn.close()
+    return rows
+
+
+def set_intent_labels(record_ids, intent):
+    """Manager correction of the intent for one or more records."""
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "UPDATE emails SET intent = ?, intent_source = 'manager' WHERE id = ?",
+            [(intent, record_id) for record_id in record_ids],
+        )
+    conn.close()
+
+
+
+# Push ingestion state (push_service)
+
+def get_sync_state(key, default=None):
+    conn = _connect()
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    conn.close()
+    return row[0] if row else default
+
+
+def set_sync_state(key, value):
+    conn = _connect()
+    with conn:
+        conn.execute("""
+            INSERT INTO sync_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (key, str(value)))
+    conn.close()
+
+
+def claim_message(gmail_id, mailbox=None):
+    """
+    Take a Gmail message for processing. Push syncs and pollers of the same mailbox
+    both see it unread; only the caller that gets True may reply to it.
+    """
+    now = int(time.time())
+    conn = _connect()
+    with conn:
+        claimed = conn.execute(
+            "INSERT OR IGNORE INTO processed_messages (gmail_id, mailbox, claimed_at) VALUES (?, ?, ?)",
+            (gmail_id, mailbox, now),
+        ).rowcount
+        # Gmail ids are never reused; old claims only need to outlive the unread window
+        conn.execute(
+            "DELETE FROM processed_messages WHERE claimed_at < ?", (now - PROCESSED_RETENTION_DAYS * 86400,)
+        )
+    conn.close()
+    return bool(claimed)
+
+
+
+# Body storage maintenance
+
+def migrate_inline_bodies(batch_size=1000):
+    """Move bodies still stored inline in emails into email_bodies. Returns: rows moved"""
+    conn = _connect()
+    moved = 0
+    while True:
+        with conn:
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM emails WHERE email_text IS NOT NULL OR reply_text IS NOT NULL LIMIT ?",
+                (batch_size,),
+            )]
+            for record_id in ids:
+                _store_body(conn, record_id)
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    conn.close()
+    return moved
+
+
+def train_body_dictionary(sample_size=2000):
+    """Train a shared compression dictionary on recent bodies and make it active. Returns: dict id"""
+    conn = _connect()
+    samples = []
+    for email_text, reply_text in conn.execute(
+        "SELECT email_text, reply_text FROM emails_full ORDER BY id DESC LIMIT ?", (sample_size,)
+    ):
+        samples.extend((email_text, reply_text))
+    codec, data = train_dictionary(samples)
+    with conn:
+        c = conn.execute(
+            "INSERT INTO compression_dicts (codec, data) VALUES (?, ?)", (codec.decode(), data)
+        )
+        dict_id = c.lastrowid
+    conn.close()
+    register_dictionary(dict_id, codec, data)
+    return dict_id
+
+
+def recompress_bodies(batch_size=1000):
+    """Re-encode stored bodies with the active dictionary."""
+    conn = _connect()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT record_id, email_text, reply_text FROM email_bodies WHERE record_id > ? ORDER BY record_id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        with conn:
+            conn.executemany(
+                "UPDATE email_bodies SET email_text = ?, reply_text = ? WHERE record_id = ?",
+                [
+                    (compress_text(decompress_text(e)), compress_text(decompress_text(r)), rid)
+                    for rid, e, r in rows
+                ],
+            )
+        last_id = rows[-1][0]
+    conn.close()
+
+
+def _init_archive(conn):
+    """Create/upgrade the attached archive schema to mirror emails + email_bodies."""
+    conn.execute("CREATE TABLE IF NOT EXISTS archive.emails AS SELECT * FROM main.emails WHERE 0")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive.email_bodies (
+        record_id INTEGER PRIMARY KEY,
+        email_text BLOB,
+        reply_text BLOB
+    )
+    """)
+    main_cols = [(r[1], r[2]) for r in conn.execute("PRAGMA main.table_info(emails)")]
+    archive_cols = {r[1] for r in conn.execute("PRAGMA archive.table_info(emails)")}
+    for name, col_type in main_cols:
+        if name not in archive_cols:
+            conn.execute(f"ALTER TABLE archive.emails ADD COLUMN {name} {col_type}")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_emails_id ON emails(id)")
+    return [name for name, _ in main_cols]
+
+
+def archive_decided_records(older_than_days=90):
+    """
+    Move records whose manager decision is older than N days (with their
+    compressed bodies) into the archive DB. Returns: number of records moved
+    """
+    conn = _connect()
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_FILE,))
+    with conn:
+        columns = ", ".join(_init_archive(conn))
+        conn.execute("""
+            CREATE TEMP TABLE to_archive AS
+            SELECT id FROM main.emails
+            WHERE manager_decision IS NOT NULL AND decided_at < datetime('now', ?)
+        """, (f"-{int(older_than_days)} days",))
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.emails ({columns})
+            SELECT {columns} FROM main.emails WHERE id IN (SELECT id FROM to_archive)
+        """)
+        conn.execute("""
+            INSERT OR REPLACE INTO archive.email_bodies
+            SELECT * FROM main.email_bodies WHERE record_id IN (SELECT id FROM to_archive)
+        """)
+        # the delete trigger also drops FTS entries and main.email_bodies rows
+        moved = conn.execute(
+            "DELETE FROM main.emails WHERE id IN (SELECT id FROM to_archive)"
+        ).rowcount
+        # archived records can't be collapsed into any more
+        conn.execute("DELETE FROM main.email_signatures WHERE record_id IN (SELECT id FROM to_archive)")
+        conn.execute("DELETE FROM main.email_lsh WHERE record_id IN (SELECT id FROM to_archive)")
+        conn.execute("DROP TABLE to_archive")
+    conn.execute("DETACH DATABASE archive")
+    conn.close()
+    return moved
+
+
+def get_archived_records(sender_email=None, limit=100):
+    """Read archived records (bodies decompressed); the archive is only opened here."""
+    if not os.path.exists(ARCHIVE_DB_FILE):
+        return []
+    conn = _connect()
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_FILE,))
+    columns = [r[1] for r in conn.execute("PRAGMA archive.table_info(emails)")]
+    select = ", ".join(
+        f"COALESCE(e.{col}, body_text(b.{col}))" if col in ("email_text", "reply_text") else f"e.{col}"
+        for col in columns
+    )
+    sql = f"SELECT {select} FROM archive.emails e LEFT JOIN archive.email_bodies b ON b.record_id = e.id"
+    params = []
+    if sender_email:
+        sql += " WHERE e.sender_email = ?"
+        params.append(sender_email)
+    sql += " ORDER BY e.id DESC LIMIT ?"
+    rows = conn.execute(sql, (*params, limit)).fetchall()
+    conn.execute("DETACH DATABASE archive")
+    conn.close()
+    return rows
+
+
 
 def print_all_records():
     rows = get_all_records()
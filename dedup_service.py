@@ -0,0 +1,147 @@
+# dedup_service.py
+import hashlib
+import os
+import random
+import re
+import time
+import zlib
+from array import array
+from db_service import save_signature, find_lsh_candidates, mark_duplicate, prune_signatures
+
+NUM_PERM = 32          # MinHash permutations
+BANDS = 8              # LSH bands (NUM_PERM / BANDS rows each)
+SHINGLE_SIZE = 3       # words per shingle
+DUPLICATE_THRESHOLD = 0.8
+MIN_WORDS = 6          # shorter bodies ("ok thanks", empty) are too generic to call duplicates
+DEDUP_WINDOW_HOURS = float(os.getenv("DEDUP_WINDOW_HOURS", "72"))
+PRUNE_INTERVAL = 3600  # seconds between deletions of index rows older than the window
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)  # fixed seed: signatures must be stable across runs
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_ROWS = NUM_PERM // BANDS
+_last_prune = 0.0
+
+
+def normalize_sender(sender: str) -> str:
+    match = re.search(r"<(.+?)>", sender or "")
+    return (match.group(1) if match else (sender or "")).strip().lower()
+
+
+def normalize_text(text: str) -> list[str]:
+    """Lowercased word tokens with digits kept (order IDs must distinguish emails)."""
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+def numeric_key(text: str) -> str:
+    """Numbers of the email in order (order IDs, quantities, prices) for the exact-match check."""
+    return " ".join(re.findall(r"\d+", text or ""))
+
+
+def minhash(text: str) -> list[int]:
+    words = normalize_text(text)
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = [zlib.crc32(s.encode()) for s in shingles]
+    return [
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMS
+    ]
+
+
+def lsh_buckets(signature: list[int]) -> list[int]:
+    """One signed 64-bit bucket id per band (band index mixed in)."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * _ROWS:(band + 1) * _ROWS]
+        digest = hashlib.blake2b(array("I", [band, *rows]).tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def similarity(sig_a, sig_b) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def find_duplicate(sender: str, email_text: str, now=None):
+    """
+    Returns: (record_id or None, signature). record_id is an existing record
+    from the same sender within the time window that this email nearly duplicates
+    and that carries exactly the same numbers (another Order ID or quantity is a new order).
+    """
+    now = int(now or time.time())
+    signature = minhash(email_text)
+    if len(normalize_text(email_text)) < MIN_WORDS:
+        return None, signature
+    since = now - int(DEDUP_WINDOW_HOURS * 3600)
+
+    best_id, best_score = None, 0.0
+    candidates = find_lsh_candidates(normalize_sender(sender), lsh_buckets(signature), since, numeric_key(email_text))
+    for record_id, blob in candidates:
+        score = similarity(signature, array("I", blob))
+        if score > best_score:
+            best_id, best_score = record_id, score
+
+    if best_score >= DUPLICATE_THRESHOLD:
+        return best_id, signature
+    return None, signature
+
+
+def index_email(record_id, sender, signature, email_text, now=None):
+    global _last_prune
+    now = int(now or time.time())
+    save_signature(
+        record_id,
+        normalize_sender(sender),
+        now,
+        array("I", signature).tobytes(),
+        lsh_buckets(signature),
+        numeric_key(email_text),
+    )
+    if time.monotonic() - _last_prune > PRUNE_INTERVAL:
+        _last_prune = time.monotonic()
+        prune_signatures(now - int(DEDUP_WINDOW_HOURS * 3600))
+
+
+def collapse_duplicate(record_id):
+    """Returns: False if the original record is gone, so the email must be handled as new"""
+    return mark_duplicate(record_id)
+
+
+# Local benchmark: lookup latency with many stored emails
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import db_service
+
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db_service.DB_FILE = os.path.join(tempfile.mkdtemp(), "dedup_bench.db")
+    db_service.init_db()
+
+    conn = db_service.sqlite3.connect(db_service.DB_FILE)
+    now = int(time.time())
+    with conn:
+        sig_rows, lsh_rows = [], []
+        for i in range(N):
+            sig = [random.getrandbits(32) for _ in range(NUM_PERM)]
+            sig_rows.append((i + 1, array("I", sig).tobytes(), "5 5678"))
+            sender = f"customer{i % 50_000}@example.com"
+            lsh_rows.extend((b, sender, now, i + 1) for b in lsh_buckets(sig))
+        conn.executemany("INSERT INTO email_signatures VALUES (?, ?, ?)", sig_rows)
+        conn.executemany("INSERT INTO email_lsh VALUES (?, ?, ?, ?)", lsh_rows)
+    conn.close()
+
+    text = "Hello, I want to order Product: Organic Oats. Quantity: 5. Order ID 5678. Thanks"
+    index_email(N + 1, "customer7@example.com", minhash(text), text, now)
+
+    runs = 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        dup_id, _ = find_duplicate("Arjun <customer7@example.com>", "  hello i want to ORDER product organic oats quantity 5 order id 5678 thanks!", now)
+    elapsed = (time.perf_counter() - start) / runs
+
+    print(f"🧪 {N} stored emails: {elapsed * 1000:.3f} ms per lookup (incl. MinHash), duplicate of #{dup_id}")
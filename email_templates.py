@@ -0,0 +1,323 @@
+# email_templates.py
+from string import Formatter
+
+
+class _CompiledTemplate:
+    """A str.format-style template parsed once into literal/field chunks."""
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [
+            (literal, field, spec)
+            for literal, field, spec, _ in Formatter().parse(text)
+        ]
+
+    def render(self, context):
+        out = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is not None:
+                value = context[field]
+                out.append(format(value, spec) if spec else str(value))
+        return "".join(out)
+
+
+# name -> (subject template, body template)
+_SOURCES = {
+    # --- Customer replies (ai_agent.generate_reply) ---
+    "customer_shipping_ack": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "Thank you for reaching out. We’ve received your shipping enquiry "
+        "for Order ID {order_id}. We will check with the vendor "
+        "and update you shortly.\n\n"
+        "Best regards,\nAI Shipping Assistant",
+    ),
+    "customer_shipping_missing_id": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "Could you please provide your Order ID so we can check your delivery status?\n\n"
+        "Thank you,\nAI Shipping Assistant",
+    ),
+    "customer_order_missing": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "We couldn’t locate your {missing_text} in the email. "
+        "Kindly share these details to help us process your request.\n\n"
+        "Thank you,\nAI Order Assistant",
+    ),
+    "customer_order_received": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "Thank you for reaching out. We have received your query regarding "
+        "Order #{order_id} for product '{product_name}'. "
+        "Our manager will review and process it shortly.\n\n"
+        "Best regards,\nAI Order Assistant",
+    ),
+    "customer_cancellation_ack": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "We’ve received your cancellation request for Order ID {order_id}. "
+        "Our manager will review it and confirm the cancellation shortly.\n\n"
+        "Best regards,\nAI Order Assistant",
+    ),
+    "customer_complaint_ack": (
+        "Re: {subject}",
+        "Dear Customer,\n\n"
+        "We’re sorry to hear about the problem with Order ID {order_id}. "
+        "Your message has been passed to our manager, who will get back to you shortly.\n\n"
+        "Best regards,\nAI Order Assistant",
+    ),
+
+    # --- Customer updates (ai_agent.send_customer_update) ---
+    "customer_update_approved": (
+        "Your Order Update – Product Shipment Confirmed",
+        """
+Dear Customer,
+
+Good news! The vendor has confirmed your product shipment.
+
+📦 Status: {vendor_status}
+💰 Payment Amount: ₹{payment_amount}
+
+Thank you for shopping with us!
+Best regards,
+AI Shipping Assistant
+""",
+    ),
+    "customer_update_rejected": (
+        "Your Order Update – Shipment Rejected",
+        """
+Dear Customer,
+
+Unfortunately, your order could not be shipped due to vendor unavailability.
+
+📦 Status: {vendor_status}
+💰 Refund Amount: ₹{payment_amount}
+
+We apologize for the inconvenience.
+Best regards,
+AI Shipping Assistant
+""",
+    ),
+
+    # --- Vendor requests (vendor_service.send_vendor_email) ---
+    "vendor_new_order": (
+        "New Order Received: {subject_product} (Order ID: {order_id})",
+        """
+Dear Vendor,
+
+A new order has been placed. Please process the shipment with the following details:
+
+- Product: {product_name}
+- Quantity: {quantity}
+- Price per unit: ₹{price}
+- Shipping charge: ₹{shipping}
+- Total cost: ₹{total_cost}
+
+Please attach at least 2 food safety certificates with the shipment confirmation email.
+
+Best regards,
+AI Order Management Assistant
+""",
+    ),
+    "vendor_shipping_status": (
+        "Shipping Status Request for Order ID: {order_id}",
+        """
+Dear Vendor,
+
+The customer has inquired about the shipping status for Order ID {order_id}.
+Kindly provide the latest shipment update (e.g., dispatched, in transit, delivered).
+
+Please attach shipment proof if available.
+
+Best regards,
+AI Shipping Assistant
+""",
+    ),
+    "vendor_fallback": (
+        "Vendor Communication",
+        "This is an automated message from the AI assistant.",
+    ),
+
+    # --- Manager dashboard (app.py) ---
+    "vendor_ship_order": (
+        "New Order Received: {product_name} (Order ID: {order_id})",
+        """
+Dear Vendor,
+
+Please ship the following product to the customer:
+
+- Product Name: {product_name}
+- Quantity: {quantity}
+- Unit Price: ₹{price}
+- Shipping Charge: ₹{shipping_charge}
+- Total Price: ₹{total_price}
+
+Kindly attach at least 2 food safety certificates with your shipment confirmation.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+    "vendor_shipment_enquiry": (
+        "Shipping Status Request for Order ID: {order_id}",
+        """
+Dear Vendor,
+
+We have received a shipment enquiry from a customer.
+
+- Order ID: {order_id}
+- Customer Email: {customer_email}
+
+Please provide the latest delivery status, estimated dispatch date, and tracking details (if available).
+Attach at least 2 food safety certificates with your reply.
+
+Best regards,
+AI Order Enquiry Assistant
+""",
+    ),
+    "vendor_certificates_approved": (
+        "Certificates Approved — Record {record_id}",
+        """Dear Vendor,
+
+We have reviewed the submitted food safety certificates for Record {record_id} and they are approved.
+Please proceed with shipment and provide tracking details/POD when available.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+    "vendor_certificates_rejected": (
+        "Certificates Rejected — Record {record_id}",
+        """Dear Vendor,
+
+After reviewing the submitted food safety certificates for Record {record_id}, we found them insufficient or invalid.
+Please resend valid food safety certificates (at least 2 valid PDFs) and include any missing shipment proof.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+
+    # --- Vendor replies (vendor_reply_service.read_vendor_emails) ---
+    "vendor_missing_certificates": (
+        "Re: {subject} - Missing Certificates",
+        """Dear Vendor,
+
+We received your shipment update for "{subject}", but only {pdf_count} certificate(s) were attached.
+Please resend with at least **2 valid PDFs**.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+    "vendor_reply_ack": (
+        "Acknowledgment — {subject}",
+        """Dear Vendor,
+
+Thank you — we received your shipment confirmation and attached certificates.
+
+📦 Shipment Status: {vendor_status}
+💰 Payment amount: ₹{payment_amount}
+📄 Certificates received: {pdf_count}
+
+The manager will review the certificates and update the customer soon.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+
+    # --- Follow-ups / SLA escalation (scheduler_service) ---
+    "vendor_followup_reminder": (
+        "Reminder: Order {order_id} – Shipment Confirmation Pending",
+        """Dear Vendor,
+
+We sent you an order for {product_name} (Order ID {order_id}, Record {record_id}) and have not yet received a shipment confirmation.
+
+Please reply with the shipment status and attach at least 2 food safety certificates.
+
+Best regards,
+AI Shipping Manager
+""",
+    ),
+    "manager_sla_escalation": (
+        "Escalation: No Vendor Reply for Record {record_id}",
+        """Hello,
+
+The vendor {vendor_email} has not confirmed Record {record_id} (Order ID {order_id}, {product_name}) within {sla_hours} hours, despite {reminders} reminder(s).
+
+Customer: {customer_email}
+
+Please follow up with the vendor or reassign the order.
+
+AI Shipping Manager
+""",
+    ),
+    "customer_delay_notice": (
+        "Your Order Update – Shipment Delayed",
+        """
+Dear Customer,
+
+We're still waiting for the vendor to confirm the shipment of your order ({product_name}, Order ID {order_id}).
+Our team has escalated this and will update you as soon as we hear back.
+
+We apologize for the delay.
+Best regards,
+AI Shipping Assistant
+""",
+    ),
+}
+
+# Compiled once at import
+TEMPLATES = {
+    name: (_CompiledTemplate(subject), _CompiledTemplate(body))
+    for name, (subject, body) in _SOURCES.items()
+}
+
+
+def render(name, **context):
+    """Render a registered template. Returns: (subject, body)"""
+    subject_tpl, body_tpl = TEMPLATES[name]
+    return subject_tpl.render(context), body_tpl.render(context)
+
+
+# Local benchmark: render + MIME encode cost per 10k messages
+
+if __name__ == "__main__":
+    import base64
+    import time
+    from email.mime.text import MIMEText
+    from gmail_service import encode_message
+
+    N = 10_000
+    contexts = [
+        {"record_id": i, "subject": f"Vendor update {i}"}
+        for i in range(N)
+    ]
+
+    start = time.perf_counter()
+    for c in contexts:
+        body = f"""Dear Vendor,
+
+We have reviewed the submitted food safety certificates for Record {c['record_id']} and they are approved.
+Please proceed with shipment and provide tracking details/POD when available.
+
+Best regards,
+AI Shipping Manager
+"""
+        message = MIMEText(body)
+        message["to"] = f"vendor{c['record_id']}@example.com"
+        message["subject"] = f"Certificates Approved — Record {c['record_id']}"
+        base64.urlsafe_b64encode(message.as_bytes()).decode()
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for c in contexts:
+        subject, body = render("vendor_certificates_approved", **c)
+        encode_message(f"vendor{c['record_id']}@example.com", subject, body)
+    compiled = time.perf_counter() - start
+
+    print(f"🧪 f-string + MIMEText: {legacy * 1000:.1f} ms / {N} messages")
+    print(f"🧪 compiled template + cached headers: {compiled * 1000:.1f} ms / {N} messages")
@@ -0,0 +1,367 @@
+# gmail_async.py
+import asyncio
+import os
+import threading
+import httpx
+from google.oauth2.credentials import Credentials
+import google.auth.transport.requests
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+
+# Overridable so the benchmark (or tests) can point at a local stub server
+GMAIL_API_BASE = os.getenv("GMAIL_API_BASE", "https://gmail.googleapis.com/gmail/v1")
+
+
+class GmailAPIError(Exception):
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"Gmail API error {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AsyncGmailClient:
+    """
+    Gmail REST client over one pooled httpx.AsyncClient (HTTP/2 keep-alive
+    when `h2` is installed). Uses the same token.json as gmail_service.
+    """
+
+    def __init__(self, token_file="token.json", user_id="me", base_url=GMAIL_API_BASE,
+                 max_connections=20, credentials=None):
+        self.user_id = user_id
+        self.creds = credentials or Credentials.from_authorized_user_file(token_file, SCOPES)
+        self._refresh_lock = asyncio.Lock()
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            http2=http2,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    # --- auth ---
+
+    async def _auth_header(self):
+        if not self.creds.valid:
+            async with self._refresh_lock:
+                # another task may have refreshed while we waited
+                if not self.creds.valid:
+                    request = google.auth.transport.requests.Request()
+                    await asyncio.to_thread(self.creds.refresh, request)
+        return {"Authorization": f"Bearer {self.creds.token}"}
+
+    async def _request(self, method, path, params=None, json=None):
+        headers = await self._auth_header()
+        response = await self._http.request(
+            method, f"users/{self.user_id}/{path}", params=params, json=json, headers=headers
+        )
+        if response.status_code >= 400:
+            raise GmailAPIError(
+                response.status_code, response.text[:300], response.headers.get("Retry-After")
+            )
+        return response.json() if response.content else {}
+
+    # --- messages ---
+
+    async def list_messages(self, label_ids=None, max_results=None, q=None, page_token=None):
+        params = {}
+        if label_ids:
+            params["labelIds"] = list(label_ids)
+        if max_results:
+            params["maxResults"] = max_results
+        if q:
+            params["q"] = q
+        if page_token:
+            params["pageToken"] = page_token
+        return await self._request("GET", "messages", params=params)
+
+    async def get_message(self, message_id, format="full"):
+        return await self._request("GET", f"messages/{message_id}", params={"format": format})
+
+    async def get_messages(self, message_ids, format="full"):
+        """Fetch many messages concurrently over the pooled connection."""
+        return await asyncio.gather(*(self.get_message(m, format) for m in message_ids))
+
+    async def modify_message(self, message_id, add_label_ids=None, remove_label_ids=None):
+        body = {
+            "addLabelIds": list(add_label_ids or []),
+            "removeLabelIds": list(remove_label_ids or []),
+        }
+        return await self._request("POST", f"messages/{message_id}/modify", json=body)
+
+    async def send_message(self, raw, thread_id=None):
+        body = {"raw": raw}
+        if thread_id:
+            body["threadId"] = thread_id
+        return await self._request("POST", "messages/send", json=body)
+
+    async def get_attachment(self, message_id, attachment_id):
+        return await self._request("GET", f"messages/{message_id}/attachments/{attachment_id}")
+
+    # --- history ---
+
+    async def list_history(self, start_history_id, history_types=None, label_id=None, page_token=None):
+        params = {"startHistoryId": start_history_id}
+        if history_types:
+            params["historyTypes"] = list(history_types)
+        if label_id:
+            params["labelId"] = label_id
+        if page_token:
+            params["pageToken"] = page_token
+        return await self._request("GET", "history", params=params)
+
+    # --- mailbox ---
+
+    async def get_profile(self):
+        return await self._request("GET", "profile")
+
+    async def watch(self, topic_name, label_ids=None):
+        body = {"topicName": topic_name}
+        if label_ids:
+            body["labelIds"] = list(label_ids)
+        return await self._request("POST", "watch", json=body)
+
+
+# Drop-in replacement for the googleapiclient resource used by the pollers.
+# Calls are executed on one background event loop so the connection pool is
+# shared by every thread; `.execute()` blocks the caller like the sync client.
+
+class _Call:
+    def __init__(self, adapter, coro_factory):
+        self._adapter = adapter
+        self._coro_factory = coro_factory
+
+    def execute(self):
+        return self._adapter.run(self._coro_factory())
+
+
+class _Batch:
+    """Stand-in for googleapiclient's BatchHttpRequest: runs calls concurrently."""
+
+    def __init__(self, adapter, callback=None):
+        self._adapter = adapter
+        self._callback = callback
+        self._calls = []
+
+    def add(self, call, callback=None, request_id=None):
+        self._calls.append((str(request_id or len(self._calls)), call, callback))
+
+    def execute(self):
+        async def run_one(call):
+            try:
+                return await call._coro_factory(), None
+            except Exception as e:
+                return None, e
+
+        async def run_all():
+            return await asyncio.gather(*(run_one(call) for _, call, _ in self._calls))
+
+        results = self._adapter.run(run_all())
+        for (request_id, _, callback), (response, exception) in zip(self._calls, results):
+            cb = callback or self._callback
+            if cb:
+                cb(request_id, response, exception)
+
+
+class _Attachments:
+    def __init__(self, adapter):
+        self._a = adapter
+
+    def get(self, userId="me", messageId=None, id=None):
+        return _Call(self._a, lambda: self._a.client.get_attachment(messageId, id))
+
+
+class _Messages:
+    def __init__(self, adapter):
+        self._a = adapter
+
+    def list(self, userId="me", labelIds=None, maxResults=None, q=None, pageToken=None):
+        return _Call(self._a, lambda: self._a.client.list_messages(labelIds, maxResults, q, pageToken))
+
+    def get(self, userId="me", id=None, format="full"):
+        return _Call(self._a, lambda: self._a.client.get_message(id, format))
+
+    def modify(self, userId="me", id=None, body=None):
+        body = body or {}
+        return _Call(self._a, lambda: self._a.client.modify_message(
+            id, body.get("addLabelIds"), body.get("removeLabelIds")
+        ))
+
+    def send(self, userId="me", body=None):
+        return _Call(self._a, lambda: self._a.client.send_message(body["raw"], body.get("threadId")))
+
+    def attachments(self):
+        return _Attachments(self._a)
+
+
+class _History:
+    def __init__(self, adapter):
+        self._a = adapter
+
+    def list(self, userId="me", startHistoryId=None, historyTypes=None, labelId=None, pageToken=None):
+        return _Call(self._a, lambda: self._a.client.list_history(
+            startHistoryId, historyTypes, labelId, pageToken
+        ))
+
+
+class _Users:
+    def __init__(self, adapter):
+        self._a = adapter
+
+    def messages(self):
+        return _Messages(self._a)
+
+    def history(self):
+        return _History(self._a)
+
+    def getProfile(self, userId="me"):
+        return _Call(self._a, lambda: self._a.client.get_profile())
+
+    def watch(self, userId="me", body=None):
+        body = body or {}
+        return _Call(self._a, lambda: self._a.client.watch(body["topicName"], body.get("labelIds")))
+
+
+class SyncGmailAdapter:
+    """Exposes AsyncGmailClient through the googleapiclient `service` interface."""
+
+    def __init__(self, **client_kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gmail-async", daemon=True)
+        self._thread.start()
+
+        async def make_client():
+            return AsyncGmailClient(**client_kwargs)
+
+        self.client = self.run(make_client())
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def close(self):
+        self.run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_adapters = {}  # token file -> adapter (one per mailbox)
+_adapter_lock = threading.Lock()
+
+
+def get_sync_adapter(token_file="token.json"):
+    """Process-wide adapter per account, so every caller shares that account's connection pool."""
+    with _adapter_lock:
+        if token_file not in _adapters:
+            _adapters[token_file] = SyncGmailAdapter(token_file=token_file)
+        return _adapters[token_file]
+
+
+# Local benchmark: sync googleapiclient vs async client against a stub server
+# (in its own process so it doesn't compete for the GIL), both with the same
+# number of requests in flight
+
+if __name__ == "__main__":
+    import json
+    import subprocess
+    import sys
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if sys.argv[1:2] == ["--stub"]:
+        LATENCY = float(sys.argv[2])  # simulated upstream latency (seconds)
+
+        class StubGmail(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def do_GET(self):
+                time.sleep(LATENCY)
+                payload = json.dumps({"id": self.path.rsplit("/", 1)[-1].split("?")[0], "payload": {}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubGmail)
+        print(server.server_port, flush=True)
+        server.serve_forever()
+
+    from concurrent.futures import ThreadPoolExecutor
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+
+    # usage: python gmail_async.py [N] [LATENCY_MS]
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    LATENCY = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+    CONCURRENCY = 20   # thread pool size = AsyncGmailClient max_connections
+
+    stub = subprocess.Popen([sys.executable, __file__, "--stub", str(LATENCY)], stdout=subprocess.PIPE, text=True)
+    root = f"http://127.0.0.1:{stub.stdout.readline().strip()}"
+
+    # httplib2 connections aren't thread-safe: one service per worker thread
+    local = threading.local()
+
+    def sync_get(message_id):
+        if not hasattr(local, "service"):
+            local.service = build(
+                "gmail", "v1", credentials=AnonymousCredentials(),
+                client_options={"api_endpoint": root}, static_discovery=True,
+            )
+        return local.service.users().messages().get(userId="me", id=message_id).execute()
+
+    ids = [str(i) for i in range(N)]
+
+    start, cpu = time.perf_counter(), time.process_time()
+    for message_id in ids:
+        sync_get(message_id)
+    sequential = time.perf_counter() - start, time.process_time() - cpu
+
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        list(pool.map(sync_get, ids[:CONCURRENCY]))  # warm up: services + connections
+        start, cpu = time.perf_counter(), time.process_time()
+        list(pool.map(sync_get, ids))
+        pooled = time.perf_counter() - start, time.process_time() - cpu
+
+    class _StaticCreds:
+        valid = True
+        token = "stub"
+
+    async def bench_async():
+        async with AsyncGmailClient(base_url=f"{root}/gmail/v1", credentials=_StaticCreds(),
+                                    max_connections=CONCURRENCY) as client:
+            await client.get_messages(ids[:CONCURRENCY])  # warm up: connections
+            start, cpu = time.perf_counter(), time.process_time()
+            await client.get_messages(ids)
+            return time.perf_counter() - start, time.process_time() - cpu
+
+    concurrent = asyncio.run(bench_async())
+    stub.terminate()
+
+    print(f"🧪 {N} messages.get, {LATENCY * 1000:.0f} ms simulated latency (wall / client CPU)")
+    for label, (wall, cpu) in [
+        ("googleapiclient, sequential", sequential),
+        (f"googleapiclient, {CONCURRENCY} threads", pooled),
+        (f"AsyncGmailClient, {CONCURRENCY} connections", concurrent),
+    ]:
+        print(f"🧪 {label:<34} {wall * 1000:6.0f} ms / {cpu * 1000:6.0f} ms")
@@ -1,52 +1,354 @@
 # gmail_service.py
 import base64
 import os.path
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from email.mime.text import MIMEText
 import google.auth.transport.requests
+from rate_limiter import call
+from mailboxes import get_mailbox
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
 
-def get_gmail_service():
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+# "sync" = googleapiclient, "async" = pooled httpx client from gmail_async
+GMAIL_TRANSPORT = os.getenv("GMAIL_TRANSPORT", "sync")
+
+# Upper bound on the decoded body handed to the regex / LLM stages
+MAX_BODY_CHARS = 20000
+
+# Lines that start the quoted history of a reply ("On ... wrote:", "Original Message")
+_QUOTE_HEADER_RE = re.compile(
+    r"^(?:On\s.+wrote:\s*$|-{2,}\s*Original Message\s*-{2,}|_{5,}\s*$)",
+    re.IGNORECASE,
+)
+# Outlook header block: a "From:" line only counts when Sent:/Date:/To: follows it
+_OUTLOOK_FROM_RE = re.compile(r"^From:\s.+", re.IGNORECASE)
+_OUTLOOK_FIELD_RE = re.compile(r"^(?:Sent|Date|To):\s", re.IGNORECASE)
+_SIGNATURE_RE = re.compile(r"^(?:--\s*|Sent from my \w+.*)$", re.IGNORECASE)
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+def get_gmail_service(mailbox=None):
+    """Gmail client for one mailbox (see mailboxes.py); None = the primary mailbox."""
+    token_file = get_mailbox(mailbox)["token_file"]
+    if GMAIL_TRANSPORT == "async":
+        from gmail_async import get_sync_adapter
+        return get_sync_adapter(token_file)
+    creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     service = build("gmail", "v1", credentials=creds)
     return service
 
-def get_latest_unread_email():
-    service = get_gmail_service()
-    results = service.users().messages().list(userId="me", labelIds=["INBOX", "UNREAD"], maxResults=5).execute()
-    messages = results.get("messages", [])
-    if not messages:
-        return None, None, None
+class _HTMLToText(HTMLParser):
+    """Collects visible text from an HTML body, skipping script/style blocks."""
+
+    _BLOCK_TAGS = {"br", "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote"}
+    _SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP_TAGS:
+            self._skip += 1
+        elif tag in self._BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in self._BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLToText()
+    parser.feed(html)
+    parser.close()
+    text = "".join(parser.chunks).replace("\xa0", " ")  # &nbsp;
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def trim_quoted_text(text: str) -> str:
+    """Drop quoted reply history and signatures, keeping only the new message."""
+    kept = []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _QUOTE_HEADER_RE.match(stripped) or _SIGNATURE_RE.match(stripped):
+            break
+        if _OUTLOOK_FROM_RE.match(stripped) and i + 1 < len(lines) and _OUTLOOK_FIELD_RE.match(lines[i + 1].strip()):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(line)
+    trimmed = "\n".join(kept).strip()
+    # Never return an empty body just because the whole mail looked quoted
+    return trimmed or text.strip()
 
-    msg = service.users().messages().get(userId="me", id=messages[0]["id"]).execute()
+
+def _part_charset(part) -> str:
+    for h in part.get("headers", []) or []:
+        if h.get("name", "").lower() == "content-type":
+            match = _CHARSET_RE.search(h.get("value", ""))
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def _decode_part(part, max_chars) -> str:
+    data = part.get("body", {}).get("data", "")
+    if not data:
+        return ""
+    # base64 expands 3 bytes into 4 chars; only decode what we can keep (x4 for multibyte)
+    limit = max_chars * 4 * 4 // 3
+    data = data[:limit - limit % 4]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    charset = _part_charset(part)
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _find_part(payload, mime_type):
+    """Depth-first walk over the MIME tree without recursion."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        if not part:
+            continue
+        if part.get("mimeType") == mime_type and not part.get("filename"):
+            if part.get("body", {}).get("data"):
+                return part
+        # reversed so the first child is visited first
+        stack.extend(reversed(part.get("parts", []) or []))
+    return None
+
+
+def extract_body(payload, max_chars: int = MAX_BODY_CHARS, trim_quotes: bool = True) -> str:
+    """
+    Extract readable text from a Gmail message payload.
+    Prefers text/plain, falls back to text/html converted to text.
+    """
+    if not payload:
+        return ""
+
+    plain = _find_part(payload, "text/plain")
+    if plain:
+        text = _decode_part(plain, max_chars)
+    else:
+        html = _find_part(payload, "text/html")
+        text = html_to_text(_decode_part(html, max_chars)) if html else ""
+
+    if trim_quotes:
+        text = trim_quoted_text(text)
+    return text[:max_chars]
+
+
+def execute(request, method, count=1, mailbox=None):
+    """Execute a Gmail API request under the mailbox's quota limiter / circuit breaker."""
+    return call(get_mailbox(mailbox)["upstream"], method, request.execute, count)
+
+
+def parse_message(msg):
+    """Returns: dict(id, thread_id, message_id, sender, subject, body) for a `format=full` message"""
     headers = msg["payload"]["headers"]
     subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
     sender = next((h["value"] for h in headers if h["name"] == "From"), "")
-    body_data = msg["payload"]["parts"][0]["body"].get("data", "")
-    body = base64.urlsafe_b64decode(body_data).decode("utf-8")
+    message_id = next((h["value"] for h in headers if h["name"].lower() == "message-id"), None)
+    return {
+        "id": msg["id"],
+        "thread_id": msg.get("threadId"),
+        "message_id": message_id,
+        "sender": sender,
+        "subject": subject,
+        "body": extract_body(msg["payload"]),
+    }
+
+
+def mark_as_read(service, message_id, mailbox=None):
+    execute(
+        service.users().messages().modify(
+            userId="me",
+            id=message_id,
+            body={"removeLabelIds": ["UNREAD"]}
+        ),
+        "messages.modify",
+        mailbox=mailbox,
+    )
+
+
+def get_latest_unread_message(mailbox=None):
+    """
+    Fetch and mark read the latest unread inbox message.
+    Returns: dict(id, thread_id, message_id, sender, subject, body) or None
+    """
+    service = get_gmail_service(mailbox)
+    results = execute(
+        service.users().messages().list(userId="me", labelIds=["INBOX", "UNREAD"], maxResults=5),
+        "messages.list",
+        mailbox=mailbox,
+    )
+    messages = results.get("messages", [])
+    if not messages:
+        return None
+
+    msg = execute(service.users().messages().get(userId="me", id=messages[0]["id"]), "messages.get", mailbox=mailbox)
+    message = parse_message(msg)
 
     # mark as read
-    service.users().messages().modify(
-        userId="me",
-        id=messages[0]["id"],
-        body={"removeLabelIds": ["UNREAD"]}
-    ).execute()
+    mark_as_read(service, messages[0]["id"], mailbox)
+
+    return message
+
+
+def list_added_message_ids(start_history_id, mailbox=None):
+    """
+    Incremental sync: ids of unread inbox messages added since `start_history_id`.
+    Returns: (message ids in arrival order, latest historyId)
+    Raises the client's 404 error when the historyId is too old; callers then resync.
+    """
+    service = get_gmail_service(mailbox)
+    ids, seen, page_token = [], set(), None
+    history_id = start_history_id
+    while True:
+        results = execute(
+            service.users().history().list(
+                userId="me",
+                startHistoryId=start_history_id,
+                historyTypes=["messageAdded"],
+                labelId="INBOX",
+                pageToken=page_token,
+            ),
+            "history.list",
+            mailbox=mailbox,
+        )
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                msg = added["message"]
+                if "UNREAD" in msg.get("labelIds", []) and msg["id"] not in seen:
+                    seen.add(msg["id"])
+                    ids.append(msg["id"])
+        history_id = results.get("historyId", history_id)
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return ids, history_id
+
+
+def get_current_history_id(mailbox=None):
+    service = get_gmail_service(mailbox)
+    return execute(service.users().getProfile(userId="me"), "getProfile", mailbox=mailbox)["historyId"]
+
+
+def start_watch(topic_name, mailbox=None):
+    """Ask Gmail to publish INBOX changes to a Pub/Sub topic. Returns: {historyId, expiration}"""
+    service = get_gmail_service(mailbox)
+    return execute(
+        service.users().watch(userId="me", body={"topicName": topic_name, "labelIds": ["INBOX"]}),
+        "watch",
+        mailbox=mailbox,
+    )
 
-    return sender, subject, body
 
+def get_latest_unread_email():
+    message = get_latest_unread_message()
+    if not message:
+        return None, None, None
+    return message["sender"], message["subject"], message["body"]
+
+
+# Static MIME header block shared by every outgoing message
+_MIME_HEADERS = (
+    b'Content-Type: text/plain; charset="utf-8"\r\n'
+    b"MIME-Version: 1.0\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+)
 
-def send_email(to, subject, body):
-    service = get_gmail_service()
-    message = MIMEText(body)
-    message["to"] = to
-    message["subject"] = subject
 
-    encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    create_message = {"raw": encoded_message}
+@lru_cache(maxsize=1024)
+def _header_block(subject):
+    """MIME headers + encoded Subject, built once per distinct subject."""
+    subject = subject.replace("\r", " ").replace("\n", " ")
+    try:
+        subject.encode("ascii")
+        encoded = subject
+    except UnicodeEncodeError:
+        # RFC 2047 encoded-word; Gmail accepts it unfolded
+        encoded = "=?utf-8?b?" + base64.b64encode(subject.encode("utf-8")).decode() + "?="
+    return _MIME_HEADERS + b"subject: " + encoded.encode("ascii") + b"\r\n"
 
-    send_message = (
-        service.users().messages().send(userId="me", body=create_message).execute()
+
+def encode_message(to, subject, body, in_reply_to=None):
+    """Build the base64url `raw` payload for messages().send()."""
+    threading_headers = b""
+    if in_reply_to:
+        ref = in_reply_to.encode("ascii", "ignore")
+        threading_headers = b"In-Reply-To: " + ref + b"\r\nReferences: " + ref + b"\r\n"
+    raw = (
+        b"to: " + to.encode("utf-8") + b"\r\n"
+        + threading_headers
+        + _header_block(subject)
+        + b"\r\n"
+        + base64.encodebytes(body.encode("utf-8"))
     )
-    return send_message
\ No newline at end of file
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def send_email(to, subject, body, thread_id=None, in_reply_to=None, mailbox=None):
+    """Send a plain-text email; pass thread_id/in_reply_to to reply inside a Gmail thread."""
+    service = get_gmail_service(mailbox)
+    create_message = {"raw": encode_message(to, subject, body, in_reply_to)}
+    if thread_id:
+        create_message["threadId"] = thread_id
+
+    send_message = execute(
+        service.users().messages().send(userId="me", body=create_message), "messages.send", mailbox=mailbox
+    )
+    return send_message
+
+
+# Gmail recommends at most 50 requests per batch
+SEND_BATCH_SIZE = 50
+
+
+def send_emails(messages, mailbox=None):
+    """
+    Send many (to, subject, body) messages over one connection using
+    HTTP batch requests. Returns: list of exceptions (None on success),
+    aligned with `messages`. A chunk that fails as a whole only fails its
+    own messages; the chunks already sent keep their results.
+    """
+    service = get_gmail_service(mailbox)
+    errors = [None] * len(messages)
+    answered = set()
+
+    def on_response(request_id, response, exception):
+        answered.add(int(request_id))
+        errors[int(request_id)] = exception
+
+    for start in range(0, len(messages), SEND_BATCH_SIZE):
+        chunk = messages[start:start + SEND_BATCH_SIZE]
+        try:
+            batch = service.new_batch_http_request(callback=on_response)
+            for i, (to, subject, body) in enumerate(chunk, start):
+                batch.add(
+                    service.users().messages().send(
+                        userId="me", body={"raw": encode_message(to, subject, body)}
+                    ),
+                    request_id=str(i),
+                )
+            execute(batch, "messages.send", count=len(chunk), mailbox=mailbox)
+        except Exception as e:
+            print(f"❌ Send batch of {len(chunk)} failed:", e)
+            for i in range(start, start + len(chunk)):
+                if i not in answered:
+                    errors[i] = e
+    return errors
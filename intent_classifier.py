@@ -0,0 +1,288 @@
+# intent_classifier.py
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+
+INTENTS = ("order", "shipping", "cancellation", "complaint", "vendor_reply")
+
+N_FEATURES = 2 ** 13       # hashed unigram / prefix / bigram buckets
+BATCH_ROWS = 256           # rows featurized per dense block (256 x 8192 float32 = 8 MB)
+TEMPERATURE = 0.03         # softmax over cosine scores; lower = sharper confidences
+MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.6"))  # below this, ask Gemini
+RETRAIN_SECONDS = 3600     # long-running workers pick up new labels this often
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")  # digits (order ids, prices) carry no intent
+_STOPWORDS = frozenset(
+    "a an the i i'd i'm we my our me you your is are was were be been it its this that to of for "
+    "in on at by and or but please kindly can could would will with as have has had do did so if".split()
+)
+PREFIX_LEN = 5  # cheap stemming: cancel/cancelled/cancellation share "cance"
+
+# Cold-start examples so the model works before any labeled history exists
+SEED_EXAMPLES = {
+    "order": [
+        "Hi, please book an order of 50 packs of brown rice for our cafe",
+        "Order request: 6 bottles of cold pressed coconut oil, price 400 each",
+        "I would like to order organic jaggery, please share the total cost",
+        "Please send 4 kg of turmeric powder and tell me the total including delivery charges",
+        "Requesting 25 bottles of mustard oil for our restaurant, what would the rate be?",
+        "We want to order 20 units of raw honey, please send an invoice",
+        "New order: Product Name Almond Butter, Qty 10, Order ID 9911",
+        "Can I buy 3 packs of millet flour? Please confirm price and availability",
+        "Placing a bulk order for our store, product list attached, order id 4410",
+        "I want to purchase organic quinoa, quantity 12",
+        "Kindly process my order for 2 jars of ghee, order number 7781",
+    ],
+    "shipping": [
+        "Any update on my delivery? Order placed last week, still not received",
+        "Track my shipment please, the courier status has not changed",
+        "Expected delivery date for my order?",
+        "It has been ten days since I paid and nothing has arrived, what is the status?",
+        "Where is my order? It was supposed to arrive yesterday",
+        "Can you share the tracking number for order 3321",
+        "Has my order been dispatched yet?",
+        "What is the delivery status of my parcel, order 1200",
+        "My package still shows in transit, when will it arrive",
+        "Please update me on the shipment of order 8890",
+        "Is order 4521 shipped? I need it by Friday",
+    ],
+    "cancellation": [
+        "Cancel my subscription order, I do not want the next delivery",
+        "Please cancel and refund, I changed my mind about the purchase",
+        "Need to cancel the order placed by mistake, kindly confirm",
+        "Please cancel my order 5678, I no longer need it",
+        "I want to cancel order ID 3321 and get a refund",
+        "Cancel the order I placed yesterday for organic oats",
+        "Kindly stop my order 7781 before it ships, I ordered by mistake",
+        "I'd like to withdraw my order 1200, please confirm the cancellation",
+        "Don't ship order 4410, we need to cancel it",
+        "Requesting cancellation of my purchase and a full refund",
+    ],
+    "complaint": [
+        "Received a damaged package, the product is spoiled, want a refund or replacement",
+        "Your delivery person was rude and the box was crushed",
+        "Poor quality rice, full of stones, not happy with this order",
+        "The honey I received was damaged and the jar was leaking, order 5678",
+        "I received the wrong product, this is not what I ordered",
+        "Very disappointed, the oats were expired on arrival",
+        "The package arrived broken and half the items are missing",
+        "Terrible service, my order came late and the quality is poor",
+        "The product smells bad, I want a replacement for order 3321",
+        "I was charged twice for order 7781, please fix this",
+    ],
+    "vendor_reply": [
+        "Dear team, goods dispatched from our warehouse, payment of 7200 pending, certificates enclosed",
+        "Supplier confirmation: consignment shipped via courier, invoice attached",
+        "We confirm receipt of your purchase order and will ship within two days",
+        "Vendor update: order shipped, payment amount 4500, certificates attached",
+        "We have dispatched the consignment, invoice and quality certificate attached",
+        "Shipment confirmed for your order, tracking attached, payment due 3200",
+        "As your supplier we confirm the goods are packed and will be dispatched tomorrow",
+        "Please find attached the lab certificate and FSSAI certificate for the shipment",
+        "Order not shipped yet due to stock shortage, will dispatch next week. Amount 2800",
+        "Delivered to your warehouse today, kindly release payment of 5600",
+    ],
+}
+
+
+def _tokens(text):
+    words = [w for w in _TOKEN_RE.findall((text or "").lower()) if w not in _STOPWORDS]
+    return (
+        words
+        + [w[:PREFIX_LEN] for w in words if len(w) > PREFIX_LEN]
+        + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    )
+
+
+def _hash(token):
+    # crc32 rather than hash(): stable across processes (str hashes are salted)
+    return zlib.crc32(token.encode()) % N_FEATURES
+
+
+def _counts(texts):
+    """Raw hashed term counts for a batch: (n, N_FEATURES) float32"""
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        buckets = [_hash(t) for t in _tokens(text)]
+        rows.extend([i] * len(buckets))
+        cols.extend(buckets)
+    flat = np.asarray(rows, dtype=np.int64) * N_FEATURES + np.asarray(cols, dtype=np.int64)
+    counts = np.bincount(flat, minlength=len(texts) * N_FEATURES)
+    return counts.reshape(len(texts), N_FEATURES).astype(np.float32)
+
+
+def _blocks(texts):
+    for start in range(0, len(texts), BATCH_ROWS):
+        yield _counts(texts[start:start + BATCH_ROWS])
+
+
+class IntentClassifier:
+    """
+    Nearest-centroid (Rocchio) classifier over hashed TF-IDF features.
+    Scoring a batch is one matrix product against the class centroids;
+    confidence is the softmax of the cosine scores.
+    """
+
+    def __init__(self):
+        self.idf = None
+        self.centroids = None  # (len(INTENTS), N_FEATURES), L2-normalized
+        self.trained_on = 0
+
+    def _vectorize(self, counts):
+        x = np.log1p(counts, out=counts) * self.idf
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        return x / np.maximum(norms, 1e-12)
+
+    def fit(self, texts, labels):
+        texts = list(texts)
+        y = np.array([INTENTS.index(label) for label in labels])
+
+        df = np.zeros(N_FEATURES, dtype=np.float32)
+        for counts in _blocks(texts):
+            df += (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+
+        sums = np.zeros((len(INTENTS), N_FEATURES), dtype=np.float32)
+        for start, counts in zip(range(0, len(texts), BATCH_ROWS), _blocks(texts)):
+            # per-class sums of this block in one scatter-add
+            np.add.at(sums, y[start:start + BATCH_ROWS], self._vectorize(counts))
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        self.centroids = sums / np.maximum(norms, 1e-12)
+        self.trained_on = len(texts)
+        return self
+
+    def predict_proba(self, texts):
+        """Returns: (n, len(INTENTS)) probabilities for a batch of texts"""
+        texts = list(texts)
+        out = np.empty((len(texts), len(INTENTS)), dtype=np.float32)
+        for start, counts in zip(range(0, len(texts), BATCH_ROWS), _blocks(texts)):
+            scores = self._vectorize(counts) @ self.centroids.T / TEMPERATURE
+            scores -= scores.max(axis=1, keepdims=True)
+            exp = np.exp(scores)
+            out[start:start + len(counts)] = exp / exp.sum(axis=1, keepdims=True)
+        return out
+
+    def predict(self, texts):
+        """Returns: list of (intent, confidence) for a batch of texts"""
+        proba = self.predict_proba(texts)
+        best = proba.argmax(axis=1)
+        return [(INTENTS[i], float(p)) for i, p in zip(best, proba[np.arange(len(best)), best])]
+
+
+def _training_set():
+    texts, labels = [], []
+    for intent, examples in SEED_EXAMPLES.items():
+        texts.extend(examples)
+        labels.extend([intent] * len(examples))
+    try:
+        from db_service import get_intent_training_rows
+
+        for text, intent in get_intent_training_rows():
+            if intent in INTENTS and text:
+                texts.append(text)
+                labels.append(intent)
+    except Exception as e:  # no DB yet: seeds only
+        print("⚠️ Intent classifier trained on seed examples only:", e)
+    return texts, labels
+
+
+_classifier = None
+_trained_at = 0.0
+_lock = threading.Lock()
+
+
+def get_classifier():
+    global _classifier, _trained_at
+    with _lock:
+        if _classifier is None or time.monotonic() - _trained_at > RETRAIN_SECONDS:
+            _classifier = IntentClassifier().fit(*_training_set())
+            _trained_at = time.monotonic()
+        return _classifier
+
+
+def classify(text):
+    """Returns: (intent, confidence) for one email"""
+    return get_classifier().predict([text])[0]
+
+
+def classify_many(texts):
+    return get_classifier().predict(texts)
+
+
+# Local test + batch benchmark
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Intent classifier: evaluate, or relabel records.")
+    parser.add_argument("--label", nargs=2, metavar=("RECORD_ID", "INTENT"),
+                        help="store a manager-corrected intent label for a record")
+    args = parser.parse_args()
+
+    if args.label:
+        from db_service import set_intent_labels
+
+        record_id, intent = args.label
+        if intent not in INTENTS:
+            parser.error(f"intent must be one of {', '.join(INTENTS)}")
+        set_intent_labels([int(record_id)], intent)
+        print(f"🏷 Record #{record_id} labeled as {intent}.")
+    else:
+        # leave-one-out over the seed set
+        texts, labels = [], []
+        for intent, examples in SEED_EXAMPLES.items():
+            texts.extend(examples)
+            labels.extend([intent] * len(examples))
+        correct = 0
+        for i in range(len(texts)):
+            model = IntentClassifier().fit(texts[:i] + texts[i + 1:], labels[:i] + labels[i + 1:])
+            correct += model.predict([texts[i]])[0][0] == labels[i]
+        print(f"🧪 Leave-one-out accuracy on seeds: {correct}/{len(texts)}")
+
+        # held-out emails: none of these (or near copies) are in SEED_EXAMPLES
+        held_out = [
+            ("order", "Hello, I'd like to place an order for Product: Organic Oats. Quantity: 5 packs. "
+                      "Price: 350 each. Order ID- 5678. Please confirm if this product is available "
+                      "and the expected delivery time."),
+            ("order", "Could you supply 15 kg of basmati rice to our hotel every month? Send the quote"),
+            ("order", "Add 2 more jars of honey to my cart and bill me, order 6612"),
+            ("order", "We need 40 packets of ragi flour for our shop next week"),
+            ("order", "I want to buy cold pressed groundnut oil, 5 litres"),
+            ("shipping", "When will my Order ID 5678 be delivered? I ordered it last week and haven't "
+                         "received any update."),
+            ("shipping", "The courier website says out for delivery since Monday, where is it?"),
+            ("shipping", "Please tell me when order 9012 will reach Chennai"),
+            ("shipping", "Has the parcel left your warehouse? No tracking yet"),
+            ("shipping", "My delivery is late, can you check the shipment status"),
+            ("cancellation", "Please cancel order 5678, I found it cheaper elsewhere"),
+            ("cancellation", "I no longer want the ghee I ordered, cancel it and refund me"),
+            ("cancellation", "Stop the shipment of order 3310, we ordered twice by mistake"),
+            ("cancellation", "Kindly cancel my monthly rice subscription from next month"),
+            ("complaint", "The jar arrived cracked and sticky, really unhappy"),
+            ("complaint", "Oats had insects in them, this is unacceptable"),
+            ("complaint", "Half the items were missing from my package and support never replied"),
+            ("complaint", "The oil tastes rancid, I want my money back"),
+            ("vendor_reply", "Vendor update: your purchase order is packed, invoice and FSSAI certificate attached"),
+            ("vendor_reply", "We shipped the consignment this morning via Blue Dart, payment of 9400 is due"),
+            ("vendor_reply", "Stock will be ready on Thursday, we will dispatch and share the lab report"),
+            ("vendor_reply", "Goods delivered to your godown, please process our invoice"),
+        ]
+        model = IntentClassifier().fit(texts, labels)
+        predictions = model.predict([text for _, text in held_out])
+        correct = confident_wrong = 0
+        for (expected, text), (intent, confidence) in zip(held_out, predictions):
+            correct += intent == expected
+            confident_wrong += intent != expected and confidence >= MIN_CONFIDENCE
+            mark = "✅" if intent == expected else "❌"
+            print(f"🧪 {mark} {intent:<13} {confidence:.2f}  {text[:60]!r}")
+        print(f"🧪 Held-out accuracy: {correct}/{len(held_out)} "
+              f"({confident_wrong} of the misses above MIN_CONFIDENCE; the others would be escalated to Gemini)")
+
+        batch = texts * (10_000 // len(texts) + 1)
+        batch = batch[:10_000]
+        start = time.perf_counter()
+        model.predict(batch)
+        print(f"🧪 {len(batch)} emails classified in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,68 @@
+# mailbox_workers.py
+import argparse
+import os
+import threading
+import time
+from db_service import init_db
+from main import main as process_customer_inbox
+from vendor_reply_service import read_vendor_emails
+from outbox_service import start_outbox_worker
+from rate_limiter import pipeline_paused
+from mailboxes import get_mailboxes, get_mailbox
+
+POLL_INTERVAL = float(os.getenv("MAILBOX_POLL_SECONDS", "60"))
+MAX_PER_POLL = 50  # customer messages handled per mailbox before yielding to the next poll
+
+
+def poll_once(name):
+    """One polling pass over a mailbox according to its role."""
+    role = get_mailbox(name)["role"]
+    # vendor pass first: in a shared inbox the customer pass marks everything it reads as read
+    if role in ("vendor", "mixed"):
+        read_vendor_emails(name)
+    if role in ("customer", "mixed"):
+        for _ in range(MAX_PER_POLL):
+            if not process_customer_inbox(name):
+                break
+
+
+def _worker(name, interval):
+    upstream = get_mailbox(name)["upstream"]
+    while True:
+        # an account out of quota only pauses its own worker
+        if pipeline_paused(upstream):
+            print(f"🛑 {name}: Gmail circuit open, skipping this poll.")
+        else:
+            try:
+                poll_once(name)
+            except Exception as e:
+                print(f"⚠️ {name} worker error:", e)
+        time.sleep(interval)
+
+
+def start_workers(names=None, interval=POLL_INTERVAL):
+    """One daemon thread per mailbox. Returns: list of threads"""
+    threads = []
+    for name in names or [m["name"] for m in get_mailboxes()]:
+        role = get_mailbox(name)["role"]  # fail fast on unknown names
+        thread = threading.Thread(target=_worker, args=(name, interval), name=f"mailbox-{name}", daemon=True)
+        thread.start()
+        threads.append(thread)
+        print(f"📮 Worker started for mailbox {name} ({role}).")
+    return threads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll each configured Gmail account on its own worker.")
+    parser.add_argument("--mailbox", action="append",
+                        help="only run these mailboxes (repeatable); run one process per host to scale out")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--outbox", action="store_true",
+                        help="also drain the outbox from this process (the dashboard already runs a sender)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.outbox:
+        start_outbox_worker()
+    for thread in start_workers(args.mailbox, args.interval):
+        thread.join()
@@ -0,0 +1,82 @@
+# mailboxes.py
+import json
+import os
+from rate_limiter import register_gmail_upstream
+
+# JSON list of accounts, e.g.
+# [{"name": "orders",   "address": "orders@example.com",  "token_file": "token_orders.json",  "role": "customer"},
+#  {"name": "vendors",  "address": "vendors@example.com", "token_file": "token_vendors.json", "role": "vendor",
+#   "units_per_second": 100},
+#  {"name": "south",    "address": "south@example.com",   "token_file": "token_south.json",   "role": "customer"}]
+# Without the file there is one "default" mailbox on token.json that receives both kinds of mail.
+MAILBOXES_FILE = os.getenv("MAILBOXES_FILE", "mailboxes.json")
+DEFAULT_MAILBOX = "default"
+ROLES = ("customer", "vendor", "mixed")
+
+_mailboxes = None
+
+
+def _load():
+    if not os.path.exists(MAILBOXES_FILE):
+        entries = [{"name": DEFAULT_MAILBOX, "token_file": "token.json", "role": "mixed"}]
+    else:
+        with open(MAILBOXES_FILE, encoding="utf-8") as f:
+            entries = json.load(f)
+        if not entries:
+            raise ValueError(f"{MAILBOXES_FILE} lists no mailboxes")
+
+    mailboxes = {}
+    for entry in entries:
+        name = entry["name"]
+        role = entry.get("role", "mixed")
+        if role not in ROLES:
+            raise ValueError(f"Mailbox {name!r}: role must be one of {', '.join(ROLES)}")
+        mailboxes[name] = {
+            "name": name,
+            "address": (entry.get("address") or "").lower() or None,
+            "token_file": entry.get("token_file", f"token_{name}.json"),
+            "role": role,
+            # own quota bucket + circuit breaker; the implicit default keeps the shared "gmail" one
+            "upstream": "gmail" if name == DEFAULT_MAILBOX else register_gmail_upstream(
+                f"gmail:{name}", entry.get("units_per_second")
+            ),
+        }
+    return mailboxes
+
+
+def get_mailboxes():
+    """Returns: list of mailbox dicts in configuration order"""
+    global _mailboxes
+    if _mailboxes is None:
+        _mailboxes = _load()
+    return list(_mailboxes.values())
+
+
+def get_mailbox(name=None):
+    """Mailbox by name; None means the first configured (primary) mailbox."""
+    mailboxes = get_mailboxes()
+    if name is None:
+        return mailboxes[0]
+    try:
+        return _mailboxes[name]
+    except KeyError:
+        raise ValueError(f"Unknown mailbox {name!r}") from None
+
+
+def mailbox_for(role):
+    """Name of the mailbox outgoing mail for `role` ("customer" / "vendor") should be sent from."""
+    mailboxes = get_mailboxes()
+    for wanted in (role, "mixed"):
+        for mailbox in mailboxes:
+            if mailbox["role"] == wanted:
+                return mailbox["name"]
+    return mailboxes[0]["name"]
+
+
+def mailbox_by_address(address):
+    """Mailbox a push notification's emailAddress belongs to, or None"""
+    address = (address or "").lower()
+    for mailbox in get_mailboxes():
+        if mailbox["address"] == address:
+            return mailbox
+    return None
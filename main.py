@@ -1,20 +1,55 @@
-from gmail_service import get_latest_unread_email, send_email
+from gmail_service import get_latest_unread_message, send_email
 from ai_agent import generate_reply
-from db_service import insert_record, init_db
+from db_service import insert_record, init_db, find_record_by_thread, merge_into_record, claim_message
+from rate_limiter import CircuitOpenError
+from dedup_service import find_duplicate, index_email, collapse_duplicate
+from mailboxes import get_mailbox
 
-def main():
+def main(mailbox=None):
+    """Process the latest unread email of one mailbox. Returns: True if there was one"""
     print("🔍 Reading latest email...")
-    sender, subject, email_text = get_latest_unread_email()
+    try:
+        message = get_latest_unread_message(mailbox)
+    except CircuitOpenError as e:
+        print("🛑 Gmail unavailable, skipping this run:", e)
+        return False
 
-    if not sender:
+    if not message:
         print("📭 No new emails.")
+        return False
+
+    process_message(message, mailbox)
+    return True
+
+
+def process_message(message, mailbox=None):
+    """Run one fetched (and already marked read) customer email through the pipeline."""
+    account = get_mailbox(mailbox)
+    sender, subject, email_text = message["sender"], message["subject"], message["body"]
+
+    # the push sync and the poller may both have picked this message up
+    if not claim_message(message["id"], account["name"]):
+        print(f"⏭️ Message {message['id']} already handled.")
         return
 
     print(f"📥 New email from: {sender}")
     print(f"📌 Subject: {subject}")
 
+    #  Collapse repeat copies of an email we already answered
+    duplicate_of, signature = find_duplicate(sender, email_text)
+    if duplicate_of and collapse_duplicate(duplicate_of):
+        print(f"♻️ Near-duplicate of record #{duplicate_of} — no new reply sent.")
+        return
+
+    #  Follow-up in a conversation we already track? (body is already trimmed of quoted history)
+    existing = find_record_by_thread(message["thread_id"])
+    if existing:
+        print(f"🧵 Follow-up in thread of record #{existing['id']}")
+
     print("🤖 Processing with AI agent...")
-    reply_text, all_ok, details, ignored = generate_reply(email_text, subject)
+    reply_text, all_ok, details, ignored = generate_reply(
+        email_text, subject, known=existing, mixed_inbox=account["role"] == "mixed"
+    )
 
     #  Skip vendor emails
     if ignored:
@@ -22,19 +57,40 @@ def main():
         return
 
     #  Send AI reply to customer
-    send_email(sender, f"Re: {subject}", reply_text)
+    reply_subject = subject if subject.lower().startswith("re:") else f"Re: {subject}"
+    send_email(
+        sender,
+        reply_subject,
+        reply_text,
+        thread_id=message["thread_id"],
+        in_reply_to=message["message_id"],
+        mailbox=mailbox,
+    )
     print("✅ Reply sent successfully.")
 
+    #  Merge follow-ups into the existing record
+    if existing:
+        merge_into_record(existing["id"], details, email_text, reply_text, all_ok)
+        print(f"💾 Record #{existing['id']} updated with follow-up details.")
+        return
+
     #  Save in database
-    insert_record(
+    record_id = insert_record(
         sender,
         email_text,
         reply_text,
         details.get("product_name"),
         details.get("price"),
         details.get("quantity"),
-        all_ok
+        all_ok,
+        order_id=details.get("order_id"),
+        thread_id=message["thread_id"],
+        sku=details.get("sku"),
+        intent=details.get("query_type"),
+        intent_source=details.get("intent_source"),
+        mailbox=account["name"],
     )
+    index_email(record_id, sender, signature, email_text)
 
     print("💾 Record saved in database.")
 
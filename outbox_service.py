@@ -0,0 +1,56 @@
+# outbox_service.py
+import threading
+import time
+from gmail_service import send_emails
+from db_service import claim_unsent_emails, mark_outbox_results
+
+POLL_INTERVAL = 5  # seconds between outbox checks in the background worker
+
+
+def flush_outbox(limit=200):
+    """Send queued emails in batches. Returns number of emails sent."""
+    rows = claim_unsent_emails(limit=limit)
+    if not rows:
+        return 0
+
+    # one batch per sending mailbox, so each account spends its own quota
+    by_mailbox = {}
+    for row in rows:
+        by_mailbox.setdefault(row[4], []).append(row)
+
+    sent_ids, failed = [], []
+    for mailbox, group in by_mailbox.items():
+        messages = [(to, subject, body) for _, to, subject, body, _ in group]
+        try:
+            errors = send_emails(messages, mailbox=mailbox)
+        except Exception as e:
+            print(f"❌ Failed to send outbox batch ({mailbox or 'primary'} mailbox):", e)
+            errors = [e] * len(group)
+        sent_ids += [row[0] for row, err in zip(group, errors) if err is None]
+        failed += [(row[0], str(err)) for row, err in zip(group, errors) if err is not None]
+    mark_outbox_results(sent_ids, failed)
+
+    print(f"📤 Outbox: {len(sent_ids)} sent, {len(failed)} failed.")
+    return len(sent_ids)
+
+
+def _worker():
+    while True:
+        try:
+            while flush_outbox():
+                pass
+        except Exception as e:
+            print("⚠️ Outbox worker error:", e)
+        time.sleep(POLL_INTERVAL)
+
+
+def start_outbox_worker():
+    """Start a daemon thread that keeps draining the outbox."""
+    thread = threading.Thread(target=_worker, name="outbox-worker", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    while flush_outbox():
+        pass
@@ -0,0 +1,192 @@
+# product_catalog.py
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+# CSV (sku,name,aliases,min_price,max_price,min_qty,max_qty) or a SQLite DB with a `products` table
+CATALOG_FILE = os.getenv("PRODUCT_CATALOG", "products.csv")
+RELOAD_CHECK_SECONDS = 2.0
+MIN_SCORE = 0.75  # share of a catalog name's trigrams that must appear in the text
+
+
+def _normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _to_float(value):
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProductCatalog:
+    """
+    In-memory trigram inverted index over product names and aliases.
+    Reloads itself when the catalog file's mtime changes.
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.products = {}       # sku -> product dict
+        self._names = []         # (normalized name, sku, trigram count)
+        self._postings = {}      # trigram -> [name index, ...]
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    # --- loading ---
+
+    def _read_rows(self):
+        if self.path.endswith((".db", ".sqlite", ".sqlite3")):
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            rows = [dict(r) for r in conn.execute("SELECT * FROM products")]
+            conn.close()
+            return rows
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    def _build(self, rows):
+        products, names, postings = {}, [], defaultdict(list)
+        for row in rows:
+            sku = (row.get("sku") or "").strip()
+            name = (row.get("name") or "").strip()
+            if not sku or not name:
+                continue
+            products[sku] = {
+                "sku": sku,
+                "name": name,
+                "min_price": _to_float(row.get("min_price")),
+                "max_price": _to_float(row.get("max_price")),
+                "min_qty": _to_float(row.get("min_qty")),
+                "max_qty": _to_float(row.get("max_qty")),
+            }
+            aliases = [a for a in (row.get("aliases") or "").split(";") if a.strip()]
+            for label in [name, *aliases]:
+                norm = _normalize(label)
+                if not norm:
+                    continue
+                grams = _trigrams(norm)
+                for g in grams:
+                    postings[g].append(len(names))
+                names.append((norm, sku, len(grams)))
+        return products, names, dict(postings)
+
+    def _maybe_reload(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < RELOAD_CHECK_SECONDS:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return  # no catalog configured: resolve() just returns None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                products, names, postings = self._build(self._read_rows())
+            except (OSError, csv.Error, sqlite3.Error) as e:
+                print("⚠️ Failed to load product catalog:", e)
+                return
+            # swap in one assignment each so readers never see a half-built index
+            self.products, self._names, self._postings = products, names, postings
+            self._mtime = mtime
+            print(f"📚 Loaded product catalog: {len(products)} products from {self.path}")
+
+    # --- lookup ---
+
+    def resolve(self, text):
+        """
+        Map free text (e.g. "Organic Oats Quantity") to the best catalog product.
+        Scores each candidate by how much of its name occurs in the text, so
+        trailing noise captured by the regex doesn't hurt. Returns: product dict or None
+        """
+        self._maybe_reload()
+        query = _normalize(text)
+        if not query or not self._postings:
+            return None
+
+        names, postings = self._names, self._postings
+        hits = defaultdict(int)
+        for g in _trigrams(query):
+            for idx in postings.get(g, ()):
+                hits[idx] += 1
+
+        best, best_key = None, None
+        for idx, shared in hits.items():
+            norm, sku, size = names[idx]
+            containment = shared / size
+            if containment < MIN_SCORE:
+                continue
+            key = (containment, size)  # prefer the most specific (longest) full match
+            if best_key is None or key > best_key:
+                best, best_key = sku, key
+        return self.products.get(best) if best else None
+
+    def validate(self, product, price=None, quantity=None):
+        """Returns: list of human-readable issues with price/quantity for a resolved product"""
+        issues = []
+        price_val, qty_val = _to_float(price), _to_float(quantity)
+        if price_val is not None:
+            if product["min_price"] is not None and price_val < product["min_price"]:
+                issues.append(f"Price ₹{price} is below the catalog minimum ₹{product['min_price']:g}")
+            if product["max_price"] is not None and price_val > product["max_price"]:
+                issues.append(f"Price ₹{price} is above the catalog maximum ₹{product['max_price']:g}")
+        if qty_val is not None:
+            if product["min_qty"] is not None and qty_val < product["min_qty"]:
+                issues.append(f"Quantity {quantity} is below the minimum order of {product['min_qty']:g}")
+            if product["max_qty"] is not None and qty_val > product["max_qty"]:
+                issues.append(f"Quantity {quantity} exceeds the maximum order of {product['max_qty']:g}")
+        return issues
+
+
+_catalog = None
+
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = ProductCatalog()
+    return _catalog
+
+
+# Local test + lookup benchmark
+
+if __name__ == "__main__":
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "products.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["sku", "name", "aliases", "min_price", "max_price", "min_qty", "max_qty"])
+        writer.writerow(["OATS-ORG-500", "Organic Oats", "rolled oats;organic oat flakes", 250, 450, 1, 100])
+        writer.writerow(["OATS-STD-500", "Oats", "", 120, 250, 1, 200])
+        writer.writerow(["HONEY-RAW-250", "Raw Forest Honey", "wild honey", 300, 600, 1, 50])
+        for i in range(5000):
+            writer.writerow([f"SKU-{i}", f"Product Item {i} Pack", "", 10, 1000, 1, 500])
+
+    catalog = ProductCatalog(path)
+    for text in ["Organic Oats Quantity", "oats", "wild honey jar", "Product item 4242 pack", "chocolate"]:
+        product = catalog.resolve(text)
+        print(f"🧪 {text!r} → {product['sku'] if product else None}")
+    print("🧪 validate:", catalog.validate(catalog.resolve("Organic Oats"), price="900", quantity="5"))
+
+    runs = 10_000
+    start = time.perf_counter()
+    for _ in range(runs):
+        catalog.resolve("Organic Oats Quantity")
+    print(f"🧪 {(time.perf_counter() - start) / runs * 1e6:.1f} µs per resolve ({len(catalog.products)} products)")
@@ -0,0 +1,262 @@
+# push_service.py
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from gmail_service import (
+    get_gmail_service,
+    execute,
+    parse_message,
+    mark_as_read,
+    list_added_message_ids,
+    get_current_history_id,
+    start_watch,
+)
+from rate_limiter import CircuitOpenError, http_status
+from db_service import init_db, get_sync_state, set_sync_state
+from main import process_message
+from vendor_reply_service import process_vendor_message
+from mailboxes import get_mailboxes, get_mailbox, mailbox_by_address, DEFAULT_MAILBOX
+
+# projects/<project>/topics/<topic> that Gmail publishes INBOX changes to
+PUBSUB_TOPIC = os.getenv("GMAIL_PUBSUB_TOPIC")
+# shared secret appended to the push endpoint URL (?token=...) in the Pub/Sub subscription
+PUSH_TOKEN = os.getenv("PUSH_VERIFICATION_TOKEN")
+COALESCE_SECONDS = float(os.getenv("PUSH_COALESCE_SECONDS", "2"))
+SAFETY_POLL_SECONDS = float(os.getenv("SAFETY_POLL_SECONDS", "900"))
+WATCH_RENEW_MARGIN = 24 * 3600  # Gmail watches expire after 7 days; renew a day early
+RESYNC_BATCH = 50
+
+
+def decode_notification(envelope):
+    """Pub/Sub push envelope -> (historyId, emailAddress)"""
+    data = base64.b64decode(envelope["message"]["data"])
+    payload = json.loads(data)
+    return int(payload["historyId"]), payload.get("emailAddress")
+
+
+def _state_key(key, mailbox):
+    # the single-mailbox setup keeps the original unsuffixed keys
+    return key if mailbox == DEFAULT_MAILBOX else f"{key}:{mailbox}"
+
+
+def _handle(service, msg_id, mailbox):
+    msg = execute(
+        service.users().messages().get(userId="me", id=msg_id, format="full"), "messages.get", mailbox=mailbox
+    )
+    # already picked up by the polling safety net (or read by a human)
+    if "UNREAD" not in msg.get("labelIds", []):
+        return
+    role = get_mailbox(mailbox)["role"]
+    if role == "mixed":
+        headers = msg["payload"]["headers"]
+        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "")
+        role = "vendor" if "vendor" in subject.lower() else "customer"
+    if role == "vendor":
+        process_vendor_message(service, msg_id, msg, mailbox)
+        return
+    message = parse_message(msg)
+    mark_as_read(service, msg_id, mailbox)
+    process_message(message, mailbox)
+
+
+class PushIngestor:
+    """
+    Turns one mailbox's push notifications into incremental syncs on its own worker thread.
+    Notifications only carry the mailbox's new historyId, so a burst collapses
+    into a single history.list from the last processed historyId. The worker also
+    wakes every SAFETY_POLL_SECONDS in case a notification was lost.
+    """
+
+    def __init__(self, mailbox=DEFAULT_MAILBOX):
+        self.mailbox = mailbox
+        self.pending = None   # highest notified historyId not yet synced
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.syncs = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"gmail-push-{self.mailbox}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def notify(self, history_id):
+        with self.lock:
+            self.pending = max(self.pending or 0, history_id)
+        self.wake.set()
+
+    def _run(self):
+        while not self.stopped:
+            if self.wake.wait(SAFETY_POLL_SECONDS):
+                time.sleep(COALESCE_SECONDS)  # let the rest of the burst arrive
+            if self.stopped:
+                return
+            self.wake.clear()
+            with self.lock:
+                notified, self.pending = self.pending, None
+            try:
+                self.sync(notified)
+                ensure_watch(self.mailbox)
+            except CircuitOpenError as e:
+                print(f"🛑 Gmail unavailable for {self.mailbox}, sync deferred:", e)
+            except Exception as e:
+                print(f"⚠️ Push sync failed for {self.mailbox}:", e)
+
+    def sync(self, notified=None):
+        """Process everything added since the stored historyId. Returns: messages handled"""
+        last = get_sync_state(_state_key("history_id", self.mailbox))
+        if last is None:
+            return self.resync()
+        if notified and notified <= int(last):
+            return 0  # covered by an earlier sync in the same burst
+
+        try:
+            ids, latest = list_added_message_ids(last, self.mailbox)
+        except Exception as e:
+            if http_status(e) == 404:  # historyId too old: Gmail only keeps about a week
+                print("⚠️ Stored historyId expired — resyncing from unread inbox.")
+                return self.resync()
+            raise
+
+        self.syncs += 1
+        service = get_gmail_service(self.mailbox)
+        for msg_id in ids:
+            _handle(service, msg_id, self.mailbox)
+        # only advance once all messages went through; a crash re-reads them,
+        # and the UNREAD check in _handle skips the ones already done
+        set_sync_state(_state_key("history_id", self.mailbox), latest)
+        if ids:
+            print(f"📬 Push sync ({self.mailbox}): {len(ids)} new message(s), historyId {last} → {latest}")
+        return len(ids)
+
+    def resync(self):
+        """First run / expired history: take the current historyId, then drain unread mail like the pollers."""
+        history_id = get_current_history_id(self.mailbox)
+        service = get_gmail_service(self.mailbox)
+        results = execute(
+            service.users().messages().list(userId="me", labelIds=["INBOX", "UNREAD"], maxResults=RESYNC_BATCH),
+            "messages.list",
+            mailbox=self.mailbox,
+        )
+        ids = [m["id"] for m in reversed(results.get("messages", []))]  # oldest first
+        for msg_id in ids:
+            _handle(service, msg_id, self.mailbox)
+        set_sync_state(_state_key("history_id", self.mailbox), history_id)
+        self.syncs += 1
+        print(f"🔄 Resynced {len(ids)} unread message(s) of {self.mailbox} at historyId {history_id}")
+        return len(ids)
+
+
+def ensure_watch(mailbox=DEFAULT_MAILBOX):
+    """(Re)register the Gmail watch when a topic is configured and the current one is about to expire."""
+    if not PUBSUB_TOPIC:
+        return
+    key = _state_key("watch_expiration", mailbox)
+    expiration = int(get_sync_state(key, 0)) / 1000
+    if expiration - time.time() > WATCH_RENEW_MARGIN:
+        return
+    response = start_watch(PUBSUB_TOPIC, mailbox)
+    set_sync_state(key, response["expiration"])
+    print(f"👀 Gmail watch for {mailbox} active on {PUBSUB_TOPIC} (historyId {response['historyId']})")
+
+
+ingestors = {}  # mailbox name -> PushIngestor
+
+
+def _ingestor_for(email_address):
+    mailbox = mailbox_by_address(email_address)
+    if mailbox:
+        return ingestors.get(mailbox["name"])
+    # single-mailbox setups don't need an address configured
+    return next(iter(ingestors.values())) if len(ingestors) == 1 else None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db()
+    for mailbox in get_mailboxes():
+        name = mailbox["name"]
+        try:
+            ensure_watch(name)
+        except Exception as e:
+            print(f"⚠️ Could not register Gmail watch for {name}:", e)
+        ingestors[name] = PushIngestor(name)
+        ingestors[name].start()
+        ingestors[name].notify(0)  # catch up on anything that arrived while we were down
+    yield
+    for ingestor in ingestors.values():
+        ingestor.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/gmail/push")
+async def gmail_push(request: Request, token: str = None):
+    if PUSH_TOKEN and token != PUSH_TOKEN:
+        raise HTTPException(status_code=403, detail="invalid token")
+    try:
+        history_id, email_address = decode_notification(await request.json())
+    except (KeyError, ValueError, TypeError) as e:
+        # ack anyway: Pub/Sub would otherwise redeliver a malformed message forever
+        print("⚠️ Ignoring malformed push notification:", e)
+        return Response(status_code=204)
+    ingestor = _ingestor_for(email_address)
+    if ingestor is None:
+        print(f"⚠️ Push notification for unknown mailbox {email_address!r} ignored.")
+        return Response(status_code=204)
+    ingestor.notify(history_id)
+    return Response(status_code=204)
+
+
+# Local stand-in for Pub/Sub: posts push envelopes the way a push subscription would
+
+def publish_local(url, history_id, email_address="me", burst=1):
+    import httpx
+
+    with httpx.Client(timeout=10) as client:
+        for i in range(burst):
+            data = json.dumps({"emailAddress": email_address, "historyId": history_id + i}).encode()
+            envelope = {
+                "message": {
+                    "data": base64.b64encode(data).decode(),
+                    "messageId": f"local-{history_id + i}",
+                    "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                },
+                "subscription": "projects/local/subscriptions/gmail-push",
+            }
+            response = client.post(url, json=envelope)
+            print(f"📤 historyId {history_id + i} → {response.status_code}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gmail push ingestion endpoint.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the webhook")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8080)
+    publish = sub.add_parser("publish", help="send test notifications to a running webhook")
+    publish.add_argument("--url", default="http://127.0.0.1:8080/gmail/push")
+    publish.add_argument("--history-id", type=int, help="defaults to the mailbox's current historyId")
+    publish.add_argument("--burst", type=int, default=1, help="notifications to send back-to-back")
+    publish.add_argument("--mailbox", help="mailbox name from mailboxes.json (default: primary)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import uvicorn
+
+        uvicorn.run(app, host=args.host, port=args.port)
+    else:
+        url = f"{args.url}?token={PUSH_TOKEN}" if PUSH_TOKEN else args.url
+        account = get_mailbox(args.mailbox)
+        history_id = args.history_id or int(get_current_history_id(account["name"]))
+        publish_local(url, history_id, email_address=account["address"] or "me", burst=args.burst)
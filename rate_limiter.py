@@ -0,0 +1,233 @@
+# rate_limiter.py
+import os
+import random
+import threading
+import time
+
+# Gmail API quota units per method (per-user limit is 250 units/second)
+GMAIL_QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.send": 100,
+    "messages.attachments.get": 5,
+    "history.list": 2,
+    "watch": 100,
+    "getProfile": 1,
+}
+GMAIL_UNITS_PER_SECOND = float(os.getenv("GMAIL_UNITS_PER_SECOND", "250"))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "10"))
+
+MAX_RETRIES = 5
+BASE_BACKOFF = 1.0   # seconds
+MAX_BACKOFF = 60.0   # seconds
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# may have taken effect even when no response came back, so never retried blindly
+NON_IDEMPOTENT_METHODS = {"messages.send"}
+# transport failures of the HTTP stacks in use, matched by name so none of them has to be installed
+_TRANSPORT_ERRORS = {"HttpLib2Error", "TransportError", "RetryError"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose refill rate adapts to quota pressure:
+    halved on every 429, recovered additively on success (AIMD).
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, units=1):
+        """Block until `units` tokens are available (larger requests drain in capacity-sized steps)."""
+        while units > self.capacity:
+            self.acquire(self.capacity)
+            units -= self.capacity
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= units:
+                    self.tokens -= units
+                    return
+                wait = (units - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, half-opens after `cooldown` seconds."""
+
+    def __init__(self, name, threshold=5, cooldown=60.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            # after the cooldown one trial call is let through (half-open)
+            return time.monotonic() - self.opened_at < self.cooldown
+
+    def check(self):
+        if self.is_open:
+            raise CircuitOpenError(f"{self.name} circuit is open; pausing calls")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"🛑 {self.name} circuit opened after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+
+
+class Upstream:
+    def __init__(self, name, bucket, breaker, units=None):
+        self.name = name
+        self.bucket = bucket
+        self.breaker = breaker
+        self.units = units or {}
+
+
+UPSTREAMS = {
+    "gmail": Upstream(
+        "gmail",
+        TokenBucket(GMAIL_UNITS_PER_SECOND),
+        CircuitBreaker("gmail"),
+        GMAIL_QUOTA_UNITS,
+    ),
+    "gemini": Upstream(
+        "gemini",
+        TokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60, capacity=max(1, GEMINI_REQUESTS_PER_MINUTE / 6)),
+        CircuitBreaker("gemini"),
+    ),
+}
+
+
+_registry_lock = threading.Lock()
+
+
+def register_gmail_upstream(name, units_per_second=None):
+    """
+    Separate Gmail quota bucket + circuit breaker for one mailbox (quota is per user),
+    so one account hitting its limit doesn't stall the others. Returns: upstream name
+    """
+    with _registry_lock:
+        if name not in UPSTREAMS:
+            UPSTREAMS[name] = Upstream(
+                name,
+                TokenBucket(float(units_per_second or GMAIL_UNITS_PER_SECOND)),
+                CircuitBreaker(name),
+                GMAIL_QUOTA_UNITS,
+            )
+    return name
+
+
+def _status_and_retry_after(exc):
+    """Pull HTTP status / Retry-After out of googleapiclient, httpx-based and google.api_core errors."""
+    resp = getattr(exc, "resp", None)  # googleapiclient.errors.HttpError
+    if resp is not None:
+        return getattr(resp, "status", None), resp.get("retry-after")
+    status = getattr(exc, "status_code", None)  # gmail_async.GmailAPIError
+    if status is None:
+        code = getattr(exc, "code", None)  # google.api_core.exceptions
+        status = code if isinstance(code, int) else None
+    return status, getattr(exc, "retry_after", None)
+
+
+def http_status(exc):
+    """HTTP status of a failed upstream call, or None if it wasn't an HTTP error."""
+    return _status_and_retry_after(exc)[0]
+
+
+def _is_transport_error(exc):
+    """Timeouts, refused / reset connections, DNS failures: the upstream never answered."""
+    return isinstance(exc, OSError) or any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(exc).__mro__)
+
+
+def _backoff(attempt, retry_after):
+    if retry_after is not None:
+        try:
+            return min(MAX_BACKOFF, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+    # full jitter
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+
+
+def call(upstream, method, fn, count=1):
+    """
+    Run fn() against an upstream with quota pacing (`count` calls' worth),
+    jittered exponential backoff on 429/5xx and transport errors, and a
+    circuit breaker. Transport errors of non-idempotent methods count
+    against the breaker but are raised without a retry.
+    Raises CircuitOpenError while the upstream is considered down.
+    """
+    up = UPSTREAMS[upstream]
+    units = up.units.get(method, 1) * count
+
+    for attempt in range(MAX_RETRIES + 1):
+        up.breaker.check()
+        up.bucket.acquire(units)
+        try:
+            result = fn()
+        except Exception as e:
+            status, retry_after = _status_and_retry_after(e)
+            if status is None and _is_transport_error(e):
+                up.breaker.record_failure()
+                if method in NON_IDEMPOTENT_METHODS:
+                    raise
+                reason = type(e).__name__
+            elif status in RETRYABLE_STATUS:
+                if status == 429:
+                    up.bucket.throttle()
+                up.breaker.record_failure()
+                reason = status
+            else:
+                raise
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt, retry_after)
+            print(f"⏳ {upstream} {method} failed ({reason}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        up.breaker.record_success()
+        up.bucket.recover()
+        return result
+
+
+def pipeline_paused(*upstreams):
+    """True while any of the given upstreams has an open circuit."""
+    return any(UPSTREAMS[u].breaker.is_open for u in upstreams)
@@ -0,0 +1,157 @@
+# scheduler_service.py
+import heapq
+import os
+import time
+from email_templates import render
+from outbox_service import flush_outbox
+from db_service import (
+    init_db,
+    get_pending_timers,
+    get_timers_after,
+    get_max_timer_id,
+    fire_timer,
+    get_record,
+    VENDOR_REMINDER_HOURS,
+    VENDOR_SLA_HOURS,
+)
+from mailboxes import mailbox_for
+
+MANAGER_EMAIL = os.getenv("MANAGER_EMAIL")
+MAX_VENDOR_REMINDERS = int(os.getenv("MAX_VENDOR_REMINDERS", "3"))
+SYNC_INTERVAL = 30  # seconds between checks for timers created by other processes
+RETRY_SECONDS = 300  # a timer that failed to fire is tried again after this
+
+
+class TimerQueue:
+    """
+    Min-heap of (due_at, timer_id) mirrored from the `timers` table.
+    Scheduling is O(log n); new rows from other processes are picked up
+    by primary-key range, and cancelled timers are dropped lazily on pop.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.last_id = 0
+
+    def load(self):
+        self.last_id = get_max_timer_id()
+        for timer in get_pending_timers():
+            self.push(timer)
+
+    def sync(self):
+        # last_id only advances here: ids from concurrent writers may interleave with
+        # our own pushes, and re-reading our own timers is harmless (fire_timer dedups)
+        for timer in get_timers_after(self.last_id):
+            self.push(timer)
+            self.last_id = max(self.last_id, timer[0])
+
+    def push(self, timer):
+        timer_id, record_id, kind, due_at, attempt = timer
+        heapq.heappush(self.heap, (due_at, timer_id, record_id, kind, attempt))
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap))
+        return due
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+
+def _details(record):
+    return {
+        "record_id": record["id"],
+        "order_id": record.get("order_id") or "N/A",
+        "product_name": record.get("product_name") or "N/A",
+        "vendor_email": record.get("vendor_email"),
+        "customer_email": record.get("sender_email"),
+    }
+
+
+def _fire(record_id, kind, attempt, now):
+    """
+    What one due timer should do, without writing anything.
+    Returns: (outgoing [(to, subject, body, mailbox)], reminder, follow_up, log line)
+    """
+    record = get_record(record_id)
+    # vendor already answered (or record archived): nothing to chase
+    if not record or record.get("vendor_status") or not record.get("vendor_email"):
+        return [], None, None, None
+    ctx = _details(record)
+
+    if kind == "vendor_reminder":
+        subject, body = render("vendor_followup_reminder", **ctx)
+        reminder = (ctx["vendor_email"], "followup", record_id)
+        follow_up = None
+        if attempt < MAX_VENDOR_REMINDERS:
+            follow_up = (record_id, "vendor_reminder", int(now + VENDOR_REMINDER_HOURS * 3600), attempt + 1)
+        return (
+            [(ctx["vendor_email"], subject, body, mailbox_for("vendor"))], reminder, follow_up,
+            f"⏰ Reminder #{attempt} queued for vendor {ctx['vendor_email']} (record #{record_id})",
+        )
+
+    if kind == "sla_escalation":
+        # answer the customer from the mailbox they wrote to
+        customer_mailbox = record.get("mailbox") or mailbox_for("customer")
+        outgoing = [(ctx["customer_email"], *render("customer_delay_notice", **ctx), customer_mailbox)]
+        if MANAGER_EMAIL:
+            outgoing.append((MANAGER_EMAIL, *render(
+                "manager_sla_escalation",
+                sla_hours=f"{VENDOR_SLA_HOURS:g}",
+                reminders=min(attempt, MAX_VENDOR_REMINDERS),
+                **ctx,
+            ), None))
+        return outgoing, None, None, (
+            f"🚨 SLA exceeded for record #{record_id}: customer notified"
+            + (", manager escalated" if MANAGER_EMAIL else "")
+        )
+
+    print(f"⚠️ Unknown timer kind {kind!r} for record #{record_id}")
+    return [], None, None, None
+
+
+def run_due(queue, now=None):
+    """Fire all timers due at `now`. Returns number of emails queued."""
+    now = now or time.time()
+    queued = 0
+    for due_at, timer_id, record_id, kind, attempt in queue.pop_due(now):
+        try:
+            outgoing, reminder, follow_up, note = _fire(record_id, kind, attempt, now)
+            # claim + outbox rows + follow-up commit together; a cancelled timer is skipped
+            claimed, follow_up_id = fire_timer(timer_id, outgoing, reminder, follow_up)
+        except Exception as e:
+            # nothing was committed: keep the timer and try again later
+            print(f"⚠️ Timer #{timer_id} failed, retrying in {RETRY_SECONDS}s:", e)
+            queue.push((timer_id, record_id, kind, int(now + RETRY_SECONDS), attempt))
+            continue
+        if not claimed:
+            continue
+        if follow_up_id:
+            queue.push((follow_up_id, *follow_up))
+        if note:
+            print(note)
+        queued += len(outgoing)
+    return queued
+
+
+def run_scheduler():
+    init_db()
+    queue = TimerQueue()
+    queue.load()
+    print(f"🕒 Scheduler started with {len(queue.heap)} pending timer(s).")
+
+    while True:
+        try:
+            queue.sync()
+            if run_due(queue):
+                flush_outbox()
+        except Exception as e:
+            print("⚠️ Scheduler error:", e)
+        next_due = queue.next_due()
+        wait = SYNC_INTERVAL if next_due is None else max(0, min(SYNC_INTERVAL, next_due - time.time()))
+        time.sleep(wait)
+
+
+if __name__ == "__main__":
+    run_scheduler()
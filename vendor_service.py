@@ -1,4 +1,6 @@
 from gmail_service import send_email
+from mailboxes import mailbox_for
+from email_templates import render
 
 def send_vendor_email(
     vendor_email,
@@ -7,7 +9,8 @@ def send_vendor_email(
     quantity=None,
     order_id=None,
     query_type="order",
-    vendor_message=None
+    vendor_message=None,
+    vendor_subject=None
 ):
     """
     Sends an email to the vendor based on the customer's query type.
@@ -28,54 +31,34 @@ def send_vendor_email(
 
     # --- ORDER REQUEST ---
     if query_type == "order":
-        subject = f"New Order Received: {product_name or 'Unknown Product'} (Order ID: {order_id or 'N/A'})"
-
-        if vendor_message:
-            body = vendor_message
-        else:
-            price_val = safe_float(price)
-            qty_val = safe_int(quantity)
-            total = price_val * qty_val
-            shipping = 50 if total > 0 else 0
-            total_cost = total + shipping
-
-            body = f"""
-Dear Vendor,
-
-A new order has been placed. Please process the shipment with the following details:
-
-- Product: {product_name or 'Not specified'}
-- Quantity: {quantity or 'Not specified'}
-- Price per unit: ₹{price or 'Not specified'}
-- Shipping charge: ₹{shipping}
-- Total cost: ₹{total_cost}
-
-Please attach at least 2 food safety certificates with the shipment confirmation email.
-
-Best regards,  
-AI Order Management Assistant
-"""
+        price_val = safe_float(price)
+        qty_val = safe_int(quantity)
+        total = price_val * qty_val
+        shipping = 50 if total > 0 else 0
+        subject, body = render(
+            "vendor_new_order",
+            subject_product=product_name or "Unknown Product",
+            product_name=product_name or "Not specified",
+            order_id=order_id or "N/A",
+            quantity=quantity or "Not specified",
+            price=price or "Not specified",
+            shipping=shipping,
+            total_cost=total + shipping,
+        )
+        body = vendor_message or body
 
     # --- SHIPPING QUERY ---
     elif query_type == "shipping":
-        subject = f"Shipping Status Request for Order ID: {order_id or 'N/A'}"
-        body = vendor_message or f"""
-Dear Vendor,
-
-The customer has inquired about the shipping status for Order ID {order_id or 'N/A'}.
-Kindly provide the latest shipment update (e.g., dispatched, in transit, delivered).
-
-Please attach shipment proof if available.
-
-Best regards,  
-AI Shipping Assistant
-"""
+        subject, body = render("vendor_shipping_status", order_id=order_id or "N/A")
+        body = vendor_message or body
 
     # --- DEFAULT FALLBACK ---
     else:
-        subject = "Vendor Communication"
-        body = vendor_message or "This is an automated message from the AI assistant."
+        subject, body = render("vendor_fallback")
+        body = vendor_message or body
+
+    subject = vendor_subject or subject
 
     # Send the email
-    send_email(vendor_email, subject, body)
+    send_email(vendor_email, subject, body, mailbox=mailbox_for("vendor"))
     print(f"✅ Vendor email sent successfully: {subject}")